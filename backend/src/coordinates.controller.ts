@@ -25,6 +25,15 @@ interface HTTPPredictionRequest {
   };
 }
 
+/**
+ * Interface for incoming HTTP batch coordinate uploads
+ */
+interface HTTPCoordinatesBatchRequest {
+  body: {
+    coordinates: { latitude: number; longitude: number; timestamp?: string }[];
+  };
+}
+
 /**
  * Interface for prediction data sent to model
  */
@@ -188,4 +197,23 @@ export class CoordinatesController {
         .json({ error: 'An error occurred while processing the request.' });
     }
   }
-}
\ No newline at end of file
+
+  /**
+   * HTTP endpoint to record a backlog of coordinates in one call
+   */
+  @Post('/batch')
+  async recordCoordinatesBatch(@Req() req: Request<HTTPCoordinatesBatchRequest>, @Res() res: Response): Promise<Response> {
+    try {
+      await this.httpService.axiosRef.post(`${this.MODEL_URL}/model/coordinates/batch`, {
+        coordinates: req.body.coordinates,
+      });
+
+      return res.status(200).json({ data: 'Coordinates recorded' });
+    } catch (err) {
+      this.log.error(`Failed to record coordinates batch: ${err.message}`);
+      return res
+        .status(500)
+        .json({ error: 'An error occurred while processing the request.' });
+    }
+  }
+}
@@ -9,6 +9,7 @@ const PROD_API_URL = 'https://my-backend-1016190626463.us-central1.run.app';
 
 export const API_BASE_URL = PROD_API_URL;
 export const COORDINATES_API = '/coordinates';
+export const COORDINATES_BATCH_API = '/coordinates/batch';
 export const NOTIFICATIONS_API = '/notifications';
 
 // Storage keys
@@ -3,7 +3,7 @@ import { LocationObject } from 'expo-location';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import axios from 'axios';
 import { BACKGROUND_LOCATION_TASK } from '../config';
-import { API_BASE_URL, COORDINATES_API } from '../config';
+import { API_BASE_URL, COORDINATES_BATCH_API } from '../config';
 
 export const BACKGROUND_TASK_NAME = 'bishop-background-tracking';
 
@@ -43,16 +43,18 @@ export const backgroundLocationTask = async ({ data, error }: { data: any; error
       return;
     }
 
-    // Send only the latest location's coordinates
-    const latestLocation = validLocations[validLocations.length - 1];
-    const response = await fetch(`${API_BASE_URL}${COORDINATES_API}`, {
+    // Send every buffered location in one call so a backlog is uploaded at once
+    const response = await fetch(`${API_BASE_URL}${COORDINATES_BATCH_API}`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({
-        latitude: latestLocation.coords.latitude,
-        longitude: latestLocation.coords.longitude
+        coordinates: validLocations.map(loc => ({
+          latitude: loc.coords.latitude,
+          longitude: loc.coords.longitude,
+          timestamp: new Date(loc.timestamp).toISOString(),
+        })),
       }),
     });
 
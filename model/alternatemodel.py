@@ -1,74 +1,197 @@
-from prophet import Prophet
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-
-class AlternateModel:
-    def __init__(self):
+from lazy import lazy_callable
+from metrics import stage_timer
+from predictor import Predictor
+
+# Prophet takes seconds to import, so only load it when this backend is actually trained
+Prophet = lazy_callable("prophet", "Prophet")
+model_to_json = lazy_callable("prophet.serialize", "model_to_json")
+model_from_json = lazy_callable("prophet.serialize", "model_from_json")
+
+# Prophet settings for each coordinate; extra seasonalities are (name, period in days, fourier_order)
+LAT_CONFIG = {
+    "changepoint_prior_scale": 0.5,  # Increased flexibility for latitude trends
+    "seasonality_prior_scale": 5.0,  # Adjusted seasonality flexibility
+    "seasonalities": [("monthly", 30.5, 5), ("hourly", 24, 3), ("quarterly", 91.25, 3)],
+}
+LON_CONFIG = {
+    "changepoint_prior_scale": 0.1,  # Increased flexibility
+    "seasonality_prior_scale": 15.0,  # Increased flexibility
+    "seasonalities": [("monthly", 30.5, 5), ("hourly", 24, 3)],
+}
+
+
+def fit_prophet(history, config):
+    """Fit one Prophet model on a (ds, y) frame and return it serialized as JSON. Runs in a worker process."""
+    model = Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=True,
+        daily_seasonality=True,
+        changepoint_prior_scale=config["changepoint_prior_scale"],
+        seasonality_prior_scale=config["seasonality_prior_scale"]
+    )
+    for name, period, fourier_order in config["seasonalities"]:
+        model.add_seasonality(name=name, period=period, fourier_order=fourier_order)
+    model.fit(history)
+    return model_to_json(model)
+
+
+def usable_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def content_hash(df):
+    """Stable hash of the training columns, used to skip refits on unchanged input."""
+    hashed = pd.util.hash_pandas_object(df[['timestamp', 'latitude', 'longitude']], index=False)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()
+
+
+class AlternateModel(Predictor):
+    backend = "prophet"
+
+    def __init__(self, cache_dir=None, history=None):
+        """cache_dir, if given, is where fitted models are persisted and reused across restarts.
+
+        It is kept in the snapshot's meta.json and options(), so retrained snapshots use it too.
+        """
+        super().__init__(history)
         self.lat_model = None
         self.lon_model = None
         self.is_trained = False
+        self.data_hash = None
+        # Latitude is fitted standardized; these undo it
+        self.lat_mean = 0.0
+        self.lat_std = 1.0
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
 
     def process_and_train(self, df):
         """
         Train Prophet models for latitude and longitude with all seasonality enabled.
         Expects df with columns: 'timestamp', 'latitude', 'longitude'
+
+        The two models are fitted concurrently in separate processes when at least two CPUs are
+        usable; each worker imports Prophet first, which takes seconds, so with one CPU both are
+        fitted here instead. Training is skipped when the input is identical to the last fit, in
+        memory or in cache_dir.
         """
-        print("Starting training ...")
+        raw_df = df
+        df = df[['timestamp', 'latitude', 'longitude']].copy()
         df['timestamp'] = pd.to_datetime(df['timestamp']).dt.tz_localize(None)
+        data_hash = content_hash(df)
+        if self.is_trained and data_hash == self.data_hash:
+            print("Training data unchanged, keeping the fitted models")
+            return
+        if self.cache_dir and self._load_cached(data_hash):
+            print("Loaded fitted models for unchanged training data from", self.cache_dir)
+            return
+
+        print("Starting training ...")
         lat_df = df[['timestamp', 'latitude']].rename(columns={'timestamp': 'ds', 'latitude': 'y'})
         lon_df = df[['timestamp', 'longitude']].rename(columns={'timestamp': 'ds', 'longitude': 'y'})
-        
-        d
-        # Print lat_df as a Python array
-        print(lat_df.to_numpy())
-        print(lon_df.to_numpy())
 
-        print("Starting fitting ...")
-        # Configure and fit the longitude model
-        self.lat_model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=True,
-            changepoint_prior_scale=0.5,  # Increased flexibility for longitude trends
-            seasonality_prior_scale=5.0  # Adjusted seasonality flexibility
-        )
-        self.lat_model.add_seasonality(name='monthly', period=30.5, fourier_order=5)
-        self.lat_model.add_seasonality(name='hourly', period=24, fourier_order=3)
-        self.lat_model.add_seasonality(name='quarterly', period=91.25, fourier_order=3)  # Added quarterly seasonality
-
-        # Normalize longitude values
-        lat_df['y'] = (lat_df['y'] - lat_df['y'].mean()) / lat_df['y'].std()
-
-        # Remove outliers in longitude
-        lat_df = lat_df[(lat_df['y'] >= -180) & (lat_df['y'] <= 180)]
+        # Normalize latitude values
+        lat_mean, lat_std = lat_df['y'].mean(), lat_df['y'].std()
+        lat_df['y'] = (lat_df['y'] - lat_mean) / lat_std
 
-        self.lat_model.fit(lat_df)
+        # Remove outliers in latitude
+        lat_df = lat_df[(lat_df['y'] >= -180) & (lat_df['y'] <= 180)]
 
-        # Configure and fit the longitude model
-        self.lon_model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=True,
-            changepoint_prior_scale=0.1,  # Increased flexibility
-            seasonality_prior_scale=15.0  # Increased flexibility
-        )
-        self.lon_model.add_seasonality(name='monthly', period=30.5, fourier_order=5)
-        self.lon_model.add_seasonality(name='hourly', period=24, fourier_order=3)  # Added hourly seasonality
-        self.lon_model.fit(lon_df)
+        print("Starting fitting ...")
+        if usable_cpus() < 2:
+            lat_json, lon_json = fit_prophet(lat_df, LAT_CONFIG), fit_prophet(lon_df, LON_CONFIG)
+        else:
+            # Prophet fitting is single-threaded, so fit both coordinates side by side
+            with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+                lat_future = executor.submit(fit_prophet, lat_df, LAT_CONFIG)
+                lon_future = executor.submit(fit_prophet, lon_df, LON_CONFIG)
+                lat_json, lon_json = lat_future.result(), lon_future.result()
+
+        self.lat_model = model_from_json(lat_json)
+        self.lon_model = model_from_json(lon_json)
+        self.data_hash = data_hash
+        self.lat_mean, self.lat_std = float(lat_mean), float(lat_std)
+        self._mark_full_train(raw_df)
+        self.is_trained = True
+        if self.cache_dir:
+            self.save_model(self.cache_dir, lat_json, lon_json)
 
         print("Completed fitting ...")
+
+    def save_model(self, base_path, lat_json=None, lon_json=None):
+        """Persist both fitted models and the hash of the data they were fitted on. Returns base_path."""
+        base_path = os.path.expanduser(base_path)
+        os.makedirs(base_path, exist_ok=True)
+        for name, serialized in (("lat_model.json", lat_json or model_to_json(self.lat_model)),
+                                 ("lon_model.json", lon_json or model_to_json(self.lon_model)),
+                                 ("data_hash", self.data_hash or "")):
+            with open(os.path.join(base_path, name), 'w') as f:
+                f.write(serialized)
+        self._save_meta(base_path, lat_mean=self.lat_mean, lat_std=self.lat_std, cache_dir=self.cache_dir)
+        return base_path
+
+    def options(self):
+        return {'cache_dir': self.cache_dir} if self.cache_dir else {}
+
+    @classmethod
+    def load_model(cls, base_path, history=None, mmap=False, build=True):
+        """Load models written by save_model."""
+        base_path = os.path.expanduser(base_path)
+        alternate_model = cls(cache_dir=cls._read_meta(base_path).get('cache_dir'), history=history)
+        alternate_model._read(base_path)
+        return alternate_model
+
+    def _read(self, base_path):
+        with open(os.path.join(base_path, "lat_model.json")) as f:
+            self.lat_model = model_from_json(f.read())
+        with open(os.path.join(base_path, "lon_model.json")) as f:
+            self.lon_model = model_from_json(f.read())
+        with open(os.path.join(base_path, "data_hash")) as f:
+            self.data_hash = f.read().strip() or None
+        meta = self._read_meta(base_path)
+        self._apply_meta(meta)
+        self.lat_mean, self.lat_std = meta['lat_mean'], meta['lat_std']
         self.is_trained = True
 
-    def predict(self, future_timestamps):
+    def _load_cached(self, data_hash):
+        hash_path = os.path.join(self.cache_dir, "data_hash")
+        if not os.path.exists(hash_path):
+            return False
+        with open(hash_path) as f:
+            if f.read().strip() != data_hash:
+                return False
+        if not os.path.exists(os.path.join(self.cache_dir, "meta.json")):
+            return False
+        version = self.version
+        self._read(self.cache_dir)
+        self.version = version
+        return True
+
+    def _check_trained(self):
+        if not self.is_trained:
+            raise ValueError("Models are not trained yet")
+
+    def _forward(self, prediction_request, timestamps):
+        with stage_timer("forward"):
+            forecast = self.forecast(timestamps)
+        return np.column_stack([forecast['predicted_latitudes'], forecast['predicted_longitudes']])
+
+    def forecast(self, future_timestamps):
         """
-        Predict latitude and longitude for given future timestamps.
+        Forecast latitude and longitude for given future timestamps.
         :param future_timestamps: list/array of timestamps (as pd.Timestamp, str, or datetime)
-        :return: DataFrame with columns 'timestamp', 'predicted_latitude', 'predicted_longitude'
+        :return: dict with lists 'timestamps', 'predicted_latitudes', 'predicted_longitudes'
         """
 
-        print(future_timestamps)
-        if not self.is_trained:
-            raise Exception("Models are not trained yet")
+        self._check_trained()
 
         if not isinstance(future_timestamps, pd.Series):
             future_timestamps = pd.Series(future_timestamps)
@@ -78,16 +201,16 @@ class AlternateModel:
         if future_timestamps.isnull().any():
             raise ValueError("Some timestamps could not be converted to datetime")
 
-        future_lat = pd.DataFrame({'ds': future_timestamps})
-        future_lon = pd.DataFrame({'ds': future_timestamps})
+        # Both models forecast over the same frame
+        future = pd.DataFrame({'ds': future_timestamps})
 
-        lat_forecast = self.lat_model.predict(future_lat)
-        lon_forecast = self.lon_model.predict(future_lon)
+        lat_forecast = self.lat_model.predict(future)
+        lon_forecast = self.lon_model.predict(future)
 
         predicted = {
             'timestamps': future_timestamps.tolist(),
-            'predicted_latitudes': lat_forecast['yhat'].tolist(),
+            'predicted_latitudes': (lat_forecast['yhat'] * self.lat_std + self.lat_mean).tolist(),
             'predicted_longitudes': lon_forecast['yhat'].tolist()
         }
 
-        return predicted
\ No newline at end of file
+        return predicted
@@ -0,0 +1,264 @@
+"""Backtest and benchmark every predictor backend on synthetic multi-user commute data, writing JSON.
+
+Each backend is trained on the first days of a few users' trajectories, one model per user the way
+tenant models are, in a fresh worker process so wall time and peak memory are its own. The held-out
+days are then replayed one step at a time: every user's next fix is predicted from their previous
+one, the prediction is scored by haversine distance, and the actual fix is recorded as history.
+Single-request and batched predict latency are measured afterwards on the same requests.
+
+Usage: python benchmark_models.py [--backends lstm prophet lookup] [--users 10] [--days 24]
+                                  [--test-days 2] [--eval-users 3] [--output benchmark_results.json]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from metrics import peak_resident_memory_bytes
+from predictor import BACKENDS, Predictor, load_predictor
+from synthetic import generate_commute_data
+from trainer import train_snapshot
+from trajectory import GRID_FREQ, haversine_distance
+
+TRAINING_COLUMNS = ["timestamp", "latitude", "longitude"]
+
+# Before bishopmodel is imported, whose own basicConfig would otherwise turn on DEBUG logging
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def train_and_measure(raw_df: pd.DataFrame, output_path: str, backend: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Train one snapshot and report its cost. Runs in its own worker process."""
+    rss_before = peak_resident_memory_bytes()
+    tracemalloc.start()
+    start = time.perf_counter()
+    train_snapshot(raw_df, output_path, 1, backend, options)
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "train_seconds": elapsed,
+        "rows": len(raw_df),
+        # Python and NumPy allocations only; TensorFlow's own allocator is not traced
+        "peak_traced_bytes": traced_peak,
+        "peak_rss_bytes": peak_resident_memory_bytes(),
+        "baseline_rss_bytes": rss_before,
+    }
+
+
+def train_in_fresh_process(raw_df: pd.DataFrame, output_path: str, backend: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(train_and_measure, raw_df, output_path, backend, options).result()
+
+
+def error_summary(errors_km: np.ndarray) -> Dict[str, float]:
+    return {
+        "mean_km": float(np.mean(errors_km)),
+        "median_km": float(np.median(errors_km)),
+        "p90_km": float(np.percentile(errors_km, 90)),
+        "rmse_km": float(np.sqrt(np.mean(errors_km ** 2))),
+    }
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    seconds = np.asarray(seconds)
+    return {
+        "mean_ms": float(seconds.mean() * 1e3),
+        "p50_ms": float(np.percentile(seconds, 50) * 1e3),
+        "p95_ms": float(np.percentile(seconds, 95) * 1e3),
+    }
+
+
+def requests_for(rows: pd.DataFrame, previous: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Predict requests for rows' timestamps, standing at the matching rows of previous."""
+    return [{
+        "timestamp": timestamp.isoformat(),
+        "current_lat": float(lat),
+        "current_long": float(lon),
+        "device_id": device_id,
+    } for timestamp, lat, lon, device_id in zip(rows["timestamp"], previous["latitude"], previous["longitude"],
+                                                 rows["device_id"])]
+
+
+def backtest(models: Dict[str, Predictor], train: pd.DataFrame, test: pd.DataFrame) -> Dict[str, Any]:
+    """Replay test one timestamp at a time, predicting each user's next fix with their own model."""
+    for device_id, model in models.items():
+        model.record_observations(train.loc[train["device_id"] == device_id, TRAINING_COLUMNS], device_id)
+
+    # Everyone starts from their last training fix
+    last = train.groupby("device_id", observed=True).tail(1).set_index("device_id")
+    predicted, actual, stayed = [], [], []
+    requests = []
+    for _, step in test.groupby("timestamp", sort=True):
+        step = step.set_index("device_id", drop=False)
+        previous = last.loc[step.index]
+        step_requests = requests_for(step, previous)
+        for device_id, request in zip(step.index, step_requests):
+            coords = models[device_id].predict([request])[0]
+            predicted.append((coords["predicted_lat"], coords["predicted_long"]))
+        requests.extend(step_requests)
+        actual.append(step[["latitude", "longitude"]].to_numpy())
+        stayed.append(previous[["latitude", "longitude"]].to_numpy())
+        for device_id, model in models.items():
+            if device_id in step.index:
+                model.record_observations(step.loc[[device_id], TRAINING_COLUMNS], device_id)
+        last.loc[step.index, ["latitude", "longitude", "timestamp"]] = step[["latitude", "longitude", "timestamp"]]
+
+    predicted, actual, stayed = np.asarray(predicted), np.concatenate(actual), np.concatenate(stayed)
+    errors_km = haversine_distance(actual[:, 0], actual[:, 1], predicted[:, 0], predicted[:, 1])
+    # Predicting that nobody moves is the bar every backend has to clear
+    baseline_km = haversine_distance(actual[:, 0], actual[:, 1], stayed[:, 0], stayed[:, 1])
+    return {
+        "predictions": len(errors_km),
+        "error": error_summary(errors_km),
+        "persistence_baseline_error": error_summary(baseline_km),
+        "requests": requests,
+    }
+
+
+def measure_latency(model: Predictor, requests: List[Dict[str, Any]], repeats: int, batch_size: int) -> Dict[str, Any]:
+    """Time predict on single requests and on batches of batch_size, without the prediction cache."""
+    model.predict(requests[:1])  # warm-up, e.g. building the Keras model
+    single = []
+    for i in range(repeats):
+        request = requests[i % len(requests)]
+        start = time.perf_counter()
+        model.predict([request])
+        single.append(time.perf_counter() - start)
+
+    batch = [requests[i % len(requests)] for i in range(batch_size)]
+    batched = []
+    for _ in range(max(1, repeats // 10)):
+        start = time.perf_counter()
+        model.predict(batch)
+        batched.append(time.perf_counter() - start)
+    return {
+        "single": latency_summary(single),
+        "batched": {"batch_size": batch_size, **latency_summary(batched)},
+        "single_throughput_per_second": len(single) / sum(single),
+        "batched_throughput_per_second": batch_size * len(batched) / sum(batched),
+    }
+
+
+def benchmark_backend(backend: str, options: Dict[str, Any], train: pd.DataFrame, test: pd.DataFrame,
+                      work_dir: str, repeats: int, batch_size: int) -> Dict[str, Any]:
+    models, training = {}, {}
+    for device_id, rows in train.groupby("device_id", observed=True):
+        output_path = os.path.join(work_dir, backend, str(device_id))
+        training[str(device_id)] = train_in_fresh_process(rows[TRAINING_COLUMNS].reset_index(drop=True),
+                                                          output_path, backend, options)
+        models[device_id] = load_predictor(output_path)
+
+    replay = backtest(models, train, test)
+    requests = replay.pop("requests")
+    # Latency is measured on one user's model and requests, so its history matches what it is asked
+    device_id, first_model = next(iter(models.items()))
+    requests = [request for request in requests if request["device_id"] == device_id]
+    train_seconds = [stats["train_seconds"] for stats in training.values()]
+    return {
+        "options": options,
+        "training": {
+            "per_user": training,
+            "mean_seconds": float(np.mean(train_seconds)),
+            "max_peak_rss_bytes": max(stats["peak_rss_bytes"] for stats in training.values()),
+            "max_peak_traced_bytes": max(stats["peak_traced_bytes"] for stats in training.values()),
+        },
+        "backtest": replay,
+        "inference": measure_latency(first_model, requests, repeats, batch_size),
+        "model_nbytes": first_model.nbytes(),
+    }
+
+
+def parse_options(values: List[str]) -> Dict[str, Dict[str, Any]]:
+    """backend.key=value pairs, values parsed as JSON where possible, e.g. lstm.epochs=5."""
+    options: Dict[str, Dict[str, Any]] = {}
+    for value in values:
+        name, raw = value.split("=", 1)
+        backend, key = name.split(".", 1)
+        try:
+            parsed = json.loads(raw)
+        except ValueError:
+            parsed = raw
+        options.setdefault(backend, {})[key] = parsed
+    return options
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--users", type=int, default=10, help="users in the generated data set")
+    # 24 days from a Monday holds out a Tuesday and Wednesday, so the backtest includes commutes
+    parser.add_argument("--days", type=int, default=24)
+    parser.add_argument("--test-days", type=int, default=2, help="trailing days held out for the backtest")
+    parser.add_argument("--eval-users", type=int, default=3, help="users a model is trained and backtested for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=200, help="single-request predict calls to time")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--option", action="append", default=["lstm.epochs=20"], metavar="BACKEND.KEY=VALUE",
+                        help="constructor option for a backend; may be repeated")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = generate_commute_data(num_users=args.users, days=args.days, interval=GRID_FREQ, seed=args.seed)
+    generator = {
+        "rows": len(data),
+        "seconds": time.perf_counter() - start,
+        "bytes": int(data.memory_usage(deep=True).sum()),
+    }
+    print(f"Generated {generator['rows']} rows in {generator['seconds']:.2f}s")
+
+    evaluated = data["device_id"].cat.categories[:args.eval_users]
+    data = data[data["device_id"].isin(evaluated)].assign(device_id=lambda df: df["device_id"].astype(str))
+    split = data["timestamp"].max().normalize() - pd.Timedelta(days=args.test_days - 1)
+    train, test = data[data["timestamp"] < split], data[data["timestamp"] >= split]
+
+    options = parse_options(args.option)
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for backend in args.backends:
+            print(f"Benchmarking {backend}...")
+            try:
+                results[backend] = benchmark_backend(backend, options.get(backend, {}), train, test, work_dir,
+                                                     args.repeats, args.batch_size)
+            except Exception as e:
+                # A backend whose dependencies are missing should not stop the others
+                logging.error("Benchmark of %s failed: %s", backend, e)
+                results[backend] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            summary = results[backend]
+            print(f"  mean error {summary['backtest']['error']['mean_km']:.3f} km "
+                  f"(stay-put baseline {summary['backtest']['persistence_baseline_error']['mean_km']:.3f} km), "
+                  f"training {summary['training']['mean_seconds']:.2f}s, "
+                  f"predict p50 {summary['inference']['single']['p50_ms']:.3f} ms")
+
+    report = {
+        "created_at": pd.Timestamp.now(tz="UTC").isoformat(),
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "generator": generator,
+        "data": {"train_rows": len(train), "test_rows": len(test), "eval_users": list(map(str, evaluated))},
+        "backends": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
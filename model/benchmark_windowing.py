@@ -0,0 +1,65 @@
+"""Benchmark LSTM sequence construction: legacy Python loop vs. strided view vs. materialized copy.
+
+Usage: python benchmark_windowing.py [--rows 15000 150000 1500000] [--max-bytes 4e9]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from bishopmodel import sliding_windows
+
+SEQUENCE_LENGTH = 144
+NUM_FEATURES = 4
+
+
+def loop_windows(features: np.ndarray, targets: np.ndarray, sequence_length: int):
+    """The original list-append implementation, kept here as the baseline."""
+    X, y = [], []
+    for i in range(len(features) - sequence_length):
+        X.append(features[i:i+sequence_length])
+        y.append(targets[i+sequence_length])
+    return np.array(X), np.array(y)
+
+
+VARIANTS = {
+    "loop": (loop_windows, True),
+    "view": (lambda f, t, s: sliding_windows(f, t, s), False),
+    "materialized": (lambda f, t, s: sliding_windows(f, t, s, materialize=True), True),
+}
+
+
+def measure(fn, features, targets):
+    tracemalloc.start()
+    start = time.perf_counter()
+    X, y = fn(features, targets, SEQUENCE_LENGTH)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return X.shape, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[15_000, 150_000, 1_500_000])
+    parser.add_argument("--max-bytes", type=float, default=4e9,
+                        help="skip copying variants whose output would exceed this many bytes")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'variant':>13} {'wall (s)':>10} {'peak (MB)':>11}  shape")
+    for rows in args.rows:
+        features = rng.random((rows, NUM_FEATURES))
+        targets = features[:, :2].copy()
+        copy_bytes = (rows - SEQUENCE_LENGTH) * SEQUENCE_LENGTH * NUM_FEATURES * features.itemsize
+        for name, (fn, copies) in VARIANTS.items():
+            if copies and copy_bytes > args.max_bytes:
+                print(f"{rows:>10} {name:>13} {'skipped':>10} {copy_bytes / 1e6:>11.1f}  (estimated)")
+                continue
+            shape, elapsed, peak = measure(fn, features, targets)
+            print(f"{rows:>10} {name:>13} {elapsed:>10.4f} {peak / 1e6:>11.1f}  {shape}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,162 @@
-from flask import Flask, request, jsonify
-from influxdb_client.client.write_api import SYNCHRONOUS
 from dotenv import load_dotenv
-from google.cloud import bigquery
+from historybuffer import DEFAULT_DEVICE
+from lazy import lazy_import
+from metrics import stage_timer
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
+import threading
+import time
+import logging
+
+bigquery = lazy_import("google.cloud.bigquery")
+
+class FakeBigQueryClient:
+    """In-process stand-in for bigquery.Client that records streamed rows, for offline testing.
+
+    Rows whose index is in fail_indexes are rejected the first time they are sent, the way
+    insert_rows_json reports per-row errors.
+    """
+
+    def __init__(self, fail_indexes=()):
+        self.project = "fake-project"
+        self.rows = []
+        self.calls = 0
+        self._fail_indexes = set(fail_indexes)
+
+    def insert_rows_json(self, table_ref, rows):
+        self.calls += 1
+        errors = []
+        for index, row in enumerate(rows):
+            if index in self._fail_indexes:
+                errors.append({"index": index, "errors": [{"reason": "backendError", "message": "fake failure"}]})
+            else:
+                self.rows.append(row)
+        self._fail_indexes = set()
+        return errors
+
+
+class InsertBuffer:
+    """Background write buffer for BigQuery streaming inserts.
+
+    Rows are sent in one insert_rows_json call once max_rows are pending or max_interval seconds
+    have passed. Rejected rows are retried up to max_retries times before being dropped.
+    """
+
+    def __init__(self, insert_rows, max_rows=500, max_interval=5.0, max_retries=3, retry_delay=0.5):
+        """insert_rows sends a list of rows and returns insert_rows_json-style per-row errors."""
+        self.insert_rows = insert_rows
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._pending = []  # (row, attempts) pairs
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.inserted = 0
+        self.dropped = 0
+
+    def add(self, rows):
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="bigquery-insert-buffer", daemon=True)
+                self._thread.start()
+            self._pending.extend((row, 0) for row in rows)
+            if len(self._pending) >= self.max_rows:
+                self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self):
+        """Send everything pending right now. Returns the rows that were dropped after exhausting retries."""
+        dropped = []
+        while True:
+            with self._condition:
+                batch, self._pending = self._pending[:self.max_rows], self._pending[self.max_rows:]
+            if not batch:
+                return dropped
+            batch_dropped, retried = self._send(batch)
+            dropped.extend(batch_dropped)
+            if retried:
+                # Back off briefly before resending rows BigQuery just rejected
+                time.sleep(self.retry_delay)
+
+    def close(self):
+        """Flush on shutdown and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        # Wait for a flush the thread has in flight, whose rejected rows it would otherwise retry after we return
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.max_rows:
+                    self._condition.wait(self.max_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def _send(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            errors = self.insert_rows(rows)
+            failed = {error["index"] for error in errors or []}
+        except Exception as e:
+            logging.warning("BigQuery insert of %d rows failed: %s", len(rows), e)
+            failed = set(range(len(rows)))
+
+        retry, dropped = [], []
+        for index, (row, attempts) in enumerate(batch):
+            if index not in failed:
+                continue
+            if attempts + 1 >= self.max_retries:
+                dropped.append(row)
+            else:
+                retry.append((row, attempts + 1))
+        self.inserted += len(rows) - len(failed)
+        self.dropped += len(dropped)
+        if dropped:
+            logging.error("Dropping %d rows after %d failed insert attempts", len(dropped), self.max_retries)
+        if retry:
+            with self._condition:
+                self._pending[:0] = retry
+        return dropped, len(retry)
+
 
 class BigQueryI:
-    def __init__(self):
+    def __init__(self, client=None, buffered=False, max_rows=500, max_interval=5.0, device_column=None,
+                 ingest_column=None):
+        """Connect to BigQuery, or use the given client (e.g. FakeBigQueryClient).
+
+        With buffered=True inserts are queued in an InsertBuffer instead of being sent one by one.
+        device_column names a STRING column holding each fix's device id; the table has none by
+        default, in which case all rows belong to the default device. ingest_column names a
+        TIMESTAMP column that inserts fill with the time they were written, unlike `timestamp`,
+        which is when the fix was taken and can be hours older for uploaded backlogs.
+        """
+        self.dataset_id = "timeseries_data_location"
+        self.table_id = "timeseries_location_table"
+        self.device_column = device_column
+        self.ingest_column = ingest_column
+        self._client = client
+        self.buffer = InsertBuffer(self._insert_rows, max_rows=max_rows, max_interval=max_interval) if buffered else None
+
+    @property
+    def client(self):
+        """The BigQuery client, connected on first use."""
+        if self._client is None:
+            self._client = self._connect()
+        return self._client
+
+    def _connect(self):
         # Load environment variables from .env file
         load_dotenv()
         print("Env var", os.getenv("ENVIRONMENT"))
@@ -22,42 +171,128 @@ class BigQueryI:
 
 
         # BigQuery configuration
-        self.client = bigquery.Client()
-        print("Connected to BigQuery:", self.client.project)
-        self.dataset_id = "timeseries_data_location"
-        self.table_id = "timeseries_location_table"
-    
-    def insert_coordinates(self, latitude, longitude):
-        # Prepare the row to insert into BigQuery
-        row = [
+        client = bigquery.Client()
+        print("Connected to BigQuery:", client.project)
+        return client
+
+    def insert_coordinates(self, latitude, longitude, timestamp=None):
+        return self.insert_many([{"latitude": latitude, "longitude": longitude, "timestamp": timestamp}])
+
+    def insert_many(self, fixes):
+        """Insert fixes given as dicts with latitude, longitude and an optional id, timestamp and device_id.
+
+        Returns BigQuery's per-row errors. Buffered inserts are queued and always return no errors;
+        failed rows are retried in the background.
+        """
+        # Prepare the rows to insert into BigQuery
+        rows = [
             {
-                "id": str(uuid.uuid4()),
-                "timestamp": datetime.now().isoformat(),
-                "coordinates": f"{longitude} {latitude}",
+                "id": fix.get("id") or str(uuid.uuid4()),
+                "timestamp": fix.get("timestamp") or datetime.now().isoformat(),
+                "coordinates": f"{fix['longitude']} {fix['latitude']}",
             }
+            for fix in fixes
         ]
+        if self.device_column:
+            for row, fix in zip(rows, fixes):
+                row[self.device_column] = fix.get("device_id")
+        if self.ingest_column:
+            ingested_at = datetime.now(timezone.utc).isoformat()
+            for row in rows:
+                row[self.ingest_column] = ingested_at
+        if self.buffer is not None:
+            self.buffer.add(rows)
+            return []
+
+        return self._insert_rows(rows)
 
-        # Insert the row into BigQuery
+    def _insert_rows(self, rows):
+        # Insert the rows into BigQuery
         table_ref = f"{self.dataset_id}.{self.table_id}"
-        errors = self.client.insert_rows_json(table_ref, row)
+        with stage_timer("bigquery_insert"):
+            errors = self.client.insert_rows_json(table_ref, rows)
         
         return errors
+
+    def close(self):
+        """Flush any buffered rows. Call on shutdown."""
+        if self.buffer is not None:
+            self.buffer.close()
     
-    def fetch_recent_data(self, limit=1000):
+    def fetch_coordinates_frame(self, since=None, ingested_since=None, ids=None):
+        """Fetch rows, oldest first, as a typed DataFrame.
+
+        All rows by default; only those with timestamp > since, written after ingested_since
+        (needs ingest_column), or with one of the given ids, when those are set. Coordinates are
+        split into float latitude/longitude columns by BigQuery itself, so no per-row parsing
+        happens in Python. With ingest_column the frame also has an ingested_at column.
+        """
+        conditions, parameters = [], []
+        if since is not None:
+            conditions.append("timestamp > @since")
+            parameters.append(bigquery.ScalarQueryParameter("since", "TIMESTAMP", since))
+        if ingested_since is not None:
+            conditions.append(f"{self.ingest_column} > @ingested_since")
+            parameters.append(bigquery.ScalarQueryParameter("ingested_since", "TIMESTAMP", ingested_since))
+        if ids is not None:
+            conditions.append("id IN UNNEST(@ids)")
+            parameters.append(bigquery.ArrayQueryParameter("ids", "STRING", list(ids)))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        device = f"{self._device()} AS device_id," if self.device_column else ""
+        ingested = f"{self.ingest_column} AS ingested_at," if self.ingest_column else ""
+        query = f"""
+        SELECT
+          id,
+          timestamp,
+          {device}
+          {ingested}
+          SAFE_CAST(SPLIT(coordinates, ' ')[SAFE_OFFSET(1)] AS FLOAT64) AS latitude,
+          SAFE_CAST(SPLIT(coordinates, ' ')[SAFE_OFFSET(0)] AS FLOAT64) AS longitude
+        FROM `{self.dataset_id}.{self.table_id}`
+        {where}
+        ORDER BY timestamp
+        """
+        with stage_timer("bigquery_query"):
+            query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=parameters))
+            df = query_job.to_dataframe()
+        print(f"Retrieved {len(df)} records from BigQuery")
+        return df
+
+    def fetch_ids(self):
+        """Every row id in the table, to find rows a cache has missed."""
+        query = f"SELECT id FROM `{self.dataset_id}.{self.table_id}`"
+        with stage_timer("bigquery_query"):
+            ids = self.client.query(query).to_dataframe()["id"]
+        return set(ids)
+
+    def _device(self):
+        # Rows written before the device column existed belong to the default device
+        return f"IFNULL({self.device_column}, '{DEFAULT_DEVICE}')"
+
+    def fetch_recent_data(self, limit=1000, device_id=None):
+        """Fetch the newest `limit` rows, newest first, only the given device's when the table has a device column."""
         try:
+            where, job_config = "", None
+            if device_id is not None and self.device_column:
+                where = f"WHERE {self._device()} = @device_id"
+                job_config = bigquery.QueryJobConfig(
+                    query_parameters=[bigquery.ScalarQueryParameter("device_id", "STRING", device_id)]
+                )
             # Create a query to fetch recent data
             query = f"""
             SELECT id, timestamp, coordinates
             FROM `{self.dataset_id}.{self.table_id}`
+            {where}
             ORDER BY timestamp DESC
             LIMIT {limit}
             """
             
-            # Run the query
-            query_job = self.client.query(query)
-            
-            # Wait for the query to complete
-            results = query_job.result()
+            with stage_timer("bigquery_query"):
+                # Run the query
+                query_job = self.client.query(query, job_config=job_config)
+
+                # Wait for the query to complete
+                results = query_job.result()
             
             # Process the results
             rows = []
@@ -73,4 +308,26 @@ class BigQueryI:
             
         except Exception as e:
             print(f"Error fetching data from BigQuery: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    def fetch_latest_per_device(self):
+        """The newest row of every device as {device_id: row}, rows shaped like fetch_recent_data's.
+
+        Needs device_column.
+        """
+        query = f"""
+        SELECT {self._device()} AS device_id, id, timestamp, coordinates
+        FROM `{self.dataset_id}.{self.table_id}`
+        WHERE TRUE
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY {self._device()} ORDER BY timestamp DESC) = 1
+        """
+        with stage_timer("bigquery_query"):
+            results = self.client.query(query).result()
+        return {
+            row.device_id: {
+                "id": row.id,
+                "timestamp": row.timestamp.isoformat() if hasattr(row.timestamp, 'isoformat') else row.timestamp,
+                "coordinates": row.coordinates
+            }
+            for row in results
+        }
@@ -1,85 +1,264 @@
+from __future__ import annotations
+
 import numpy as np
 import pandas as pd
-from faker import Faker
-from datetime import datetime, timedelta
-import tensorflow as tf
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import MinMaxScaler
+from lazy import lazy_import, lazy_callable
 import pickle
 import os
-from typing import List, Tuple, Dict, Any
+import time
+from typing import List, Tuple, Dict, Any, Optional
 import logging
+from historybuffer import HistoryBuffer, DEFAULT_DEVICE
+from metrics import STAGE_SECONDS, stage_timer
+from features import (TARGET_COLUMNS, FeatureCache, build_features, scale, sequence_inputs, time_features,
+                      unscale)
+from predictor import Predictor
+from synthetic import generate_commute_data
+from trajectory import GRID_FREQ, haversine_distance, preprocess_fixes
+
+# Heavy dependencies are imported on first use so the server starts quickly
+tf = lazy_import("tensorflow")
+MinMaxScaler = lazy_callable("sklearn.preprocessing", "MinMaxScaler")
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def generate_synthetic_data(num_samples: int = 15000, base_lat: float = 40.0190, base_lon: float = 105.2747) -> pd.DataFrame:
-    """Generate basic synthetic location data with timestamps."""
-    fake = Faker()
-    start_date = fake.date_time_between(start_date='-100d', end_date='-99d')
-    timestamps = [start_date + timedelta(minutes=10*i) for i in range(num_samples)]
-    latitudes = [base_lat + np.random.normal(0, 0.01) for _ in range(num_samples)]
-    longitudes = [base_lon + np.random.normal(0, 0.01) for _ in range(num_samples)]
-
-    df = pd.DataFrame({
-        'timestamp': timestamps,
-        'latitude': latitudes,
-        'longitude': longitudes
-    })
-    
-    return df
-
-class BishopModel:
-    def __init__(self, sequence_length: int = 144):
-        """Initialize BishopModel with specified sequence length."""
+def generate_synthetic_data(num_samples: int = 15000, base_lat: float = 40.0190, base_lon: float = 105.2747,
+                            seed: Optional[int] = None) -> pd.DataFrame:
+    """Generate num_samples 10-minute fixes of a single commuting device, see synthetic.generate_commute_data."""
+    days = -(-num_samples // int(pd.Timedelta(days=1) / GRID_FREQ))
+    df = generate_commute_data(num_users=1, days=days, interval=GRID_FREQ, base_lat=base_lat, base_lon=base_lon,
+                               seed=seed)
+    return df.loc[:num_samples - 1, ['timestamp', 'latitude', 'longitude']]
+
+def sliding_windows(features: np.ndarray, targets: np.ndarray, sequence_length: int,
+                    materialize: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Pair every sequence_length window of features with the target row that follows it.
+
+    Returns X of shape (n - sequence_length, sequence_length, num_features) and y of shape
+    (n - sequence_length, num_targets). X is a strided view sharing memory with features
+    unless materialize is True.
+    """
+    num_windows = max(len(features) - sequence_length, 0)
+    if num_windows == 0:
+        return np.empty((0, sequence_length, features.shape[1])), np.empty((0, targets.shape[1]))
+
+    # Shape (n - sequence_length + 1, 1, sequence_length, num_features); the last window has no target
+    X = np.lib.stride_tricks.sliding_window_view(features, (sequence_length, features.shape[1]))
+    X = X[:num_windows, 0]
+    y = targets[sequence_length:]
+    if materialize:
+        X = np.ascontiguousarray(X)
+    return X, y
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    # The tanh form does not overflow for large negative inputs
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def _lstm(x: np.ndarray, kernel: np.ndarray, recurrent_kernel: np.ndarray, bias: np.ndarray, reverse: bool,
+          return_sequences: bool) -> np.ndarray:
+    """One direction of a Keras LSTM layer (gates in i, f, c, o order) over x of shape (batch, steps, features)."""
+    batch, steps, _ = x.shape
+    units = recurrent_kernel.shape[0]
+    # The input projection for every step at once; only the recurrent part is sequential
+    projected = x @ kernel + bias
+    h = np.zeros((batch, units), dtype=x.dtype)
+    c = np.zeros((batch, units), dtype=x.dtype)
+    outputs = np.empty((batch, steps, units), dtype=x.dtype) if return_sequences else None
+    for t in (range(steps - 1, -1, -1) if reverse else range(steps)):
+        z = projected[:, t] + h @ recurrent_kernel
+        c = _sigmoid(z[:, units:2 * units]) * c + _sigmoid(z[:, :units]) * np.tanh(z[:, 2 * units:3 * units])
+        h = _sigmoid(z[:, 3 * units:]) * np.tanh(c)
+        if return_sequences:
+            # Keras lines the backward direction's outputs up with the input steps again
+            outputs[:, t] = h
+    return outputs if return_sequences else h
+
+
+def lstm_forward(weights: List[np.ndarray], X: np.ndarray, bidirectional_layers: int = 3) -> np.ndarray:
+    """The network built by BishopModel.build_lstm_model, evaluated with NumPy on its get_weights() list.
+
+    Reads the weight arrays without copying them, so memory-mapped weights stay shared through the
+    page cache between every process serving the same snapshot. Dropout is a no-op at inference.
+    """
+    x = np.asarray(X, dtype=np.float32)
+    for layer in range(bidirectional_layers):
+        last = layer == bidirectional_layers - 1
+        forward, backward = weights[layer * 6:layer * 6 + 3], weights[layer * 6 + 3:layer * 6 + 6]
+        x = np.concatenate([_lstm(x, *forward, reverse=False, return_sequences=not last),
+                            _lstm(x, *backward, reverse=True, return_sequences=not last)], axis=-1)
+    dense = weights[bidirectional_layers * 6:]
+    for i in range(0, len(dense), 2):
+        x = x @ dense[i] + dense[i + 1]
+        if i + 2 < len(dense):
+            x = np.maximum(x, 0)
+    return x
+
+
+class BishopModel(Predictor):
+    backend = "lstm"
+    supports_fine_tune = True
+
+    def __init__(self, sequence_length: int = 144, history: Optional[HistoryBuffer] = None, compress: bool = True,
+                 epochs: int = 200, streaming: bool = True):
+        """Initialize BishopModel with specified sequence length and an optional shared history buffer.
+
+        With compress, training data goes through trajectory.preprocess_fixes first: stay points are
+        collapsed and the fixes resampled onto the 10-minute grid the sequence length is counted in.
+        Training frames may carry a device_id column; each device is then preprocessed on its own and
+        only windows within one device are trained on.
+        epochs caps training from scratch; early stopping usually ends it sooner. streaming trains
+        from a tf.data pipeline that cuts windows on the fly instead of from an in-memory split.
+        """
         logging.info("Initializing BishopModel with sequence length: %d", sequence_length)
+        super().__init__(history if history is not None else HistoryBuffer(sequence_length))
         self.sequence_length = sequence_length
+        self.compress = compress
+        self.epochs = epochs
+        self.streaming = streaming
         self.model = None
-        self.scaler_features = MinMaxScaler()
-        self.scaler_targets = MinMaxScaler()
-    
+        # Weights loaded by load_model(build=False). Predictions run on them with lstm_forward, and
+        # they are only copied into a Keras model when one is needed, e.g. for fine-tuning
+        self._pending_weights: Optional[List[np.ndarray]] = None
+        # Fitted by training or load_model
+        self.scaler_features = None
+        self.scaler_targets = None
+        # Scaled history windows for predict; only valid for this snapshot's scalers
+        self.feature_cache = FeatureCache()
+
     def add_time_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Add time-based features to the dataframe."""
-        logging.debug("Adding time-based features to the dataframe")
-        df['timestamp'] = pd.to_datetime(df['timestamp'])  # Ensure timestamp is datetime
-        df['minute_of_day'] = df['timestamp'].dt.hour * 60 + df['timestamp'].dt.minute
-        df['day_of_week'] = df['timestamp'].dt.dayofweek
-        
-        # Optionally add more time features
-        df['hour'] = df['timestamp'].dt.hour
-        df['is_weekend'] = df['day_of_week'].apply(lambda x: 1 if x >= 5 else 0)
-        logging.debug("Time-based features added: %s", df.head())
-        return df
-
-    def prepare_data_for_lstm(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
-        """Scale features and prepare sequences for LSTM model."""
-        logging.info("Preparing data for LSTM with sequence length: %d", self.sequence_length)
+        """Return a copy of df with time-based feature columns (in UTC) added."""
+        minute_of_day, day_of_week = time_features(df['timestamp'])
+        return df.assign(minute_of_day=minute_of_day, day_of_week=day_of_week, hour=minute_of_day // 60,
+                         is_weekend=(day_of_week >= 5).astype(int))
+
+    @staticmethod
+    def _features(df: pd.DataFrame) -> np.ndarray:
+        return build_features(df['timestamp'], df['latitude'], df['longitude'])
+
+    def record_observations(self, df: pd.DataFrame, device_id: str = DEFAULT_DEVICE) -> int:
+        """Push observed fixes (timestamp, latitude, longitude) into the device's rolling history.
+
+        With compress the fixes are put on the training grid first, so prediction windows have the
+        spacing the model was trained on.
+        """
+        if not self.compress:
+            added = self.history.extend(device_id, df['timestamp'], self._features(df))
+        else:
+            rows, observed_until = self._grid_rows(df, device_id)
+            if rows.empty:
+                return 0
+            added = self.history.extend(device_id, rows['timestamp'], self._features(rows), observed_until=observed_until)
+        logging.debug("Recorded %d new observations for device %s", added, device_id)
+        return added
+
+    def _grid_rows(self, df: pd.DataFrame, device_id: str) -> Tuple[pd.DataFrame, Optional[pd.Timestamp]]:
+        """Fixes the device's history has not seen, as preprocess_fixes grid rows continuing its window.
+
+        Fixes in the newest buffered grid step are returned stamped with that step, for the history
+        to average in. Later ones go through preprocess_fixes together with the newest buffered row,
+        so gaps after it are filled the way training fills them. Also returns the newest fix's time.
+        """
+        fixes = df[['timestamp', 'latitude', 'longitude']].dropna()
+        timestamps = pd.to_datetime(fixes['timestamp'], utc=True).dt.tz_localize(None)
+        fixes = fixes.assign(timestamp=timestamps)
+        seen = self.history.observed_until(device_id)
+        if seen is not None:
+            fixes = fixes[fixes['timestamp'] > seen]
+        if fixes.empty:
+            return fixes, None
+        observed_until = fixes['timestamp'].max()
+
+        last = self.history.last(device_id)
+        if last is None:
+            return preprocess_fixes(fixes), observed_until
+        last_step, last_row = last
+        steps = fixes['timestamp'].dt.floor(GRID_FREQ)
+        # Fixes older than the newest step arrived too late to change the window
+        current = fixes[steps == last_step].assign(timestamp=last_step)
+        later = fixes[steps > last_step]
+        if later.empty:
+            return current, observed_until
+        anchor = pd.DataFrame({'timestamp': [last_step], 'latitude': [last_row[0]], 'longitude': [last_row[1]]})
+        grid = preprocess_fixes(pd.concat([anchor, later], ignore_index=True))
+        return pd.concat([current, grid[grid['timestamp'] > last_step]], ignore_index=True), observed_until
+
+    def _fit_scalers(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Refit both scalers on df and return the scaled feature and target arrays."""
         # Reinitalize
         self.scaler_features = MinMaxScaler()
         self.scaler_targets = MinMaxScaler()
 
-        # If the dataframe length is less than the sequence length, duplicate entries
-        if len(df) < self.sequence_length:
-            logging.warning("Dataframe length (%d) is less than sequence length (%d). Duplicating entries.", len(df), self.sequence_length)
-            df = pd.concat([df] * self.sequence_length, ignore_index=True)
-            # df = df.iloc[:self.sequence_length]
-
-        self.scaler_features = self.scaler_features.fit_transform(df[['latitude', 'longitude', 'minute_of_day', 'day_of_week']])
-        self.scaler_targets = self.scaler_targets.fit_transform(df[['latitude', 'longitude']])
-        
-        # Ensure self.scaler_features has enough length for sequence creation
-        # if len(self.scaler_features) < self.sequence_length:
-        #     self.scaler_features = np.tile(self.scaler_features, (self.sequence_length, 1))
-        #     self.scaler_targets = np.tile(self.scaler_targets, (self.sequence_length, 1))
-
-
-        X, y = [], []  # Initialize X and y as empty lists
-        for i in range(len(self.scaler_features) - self.sequence_length):
-            X.append(self.scaler_features[i:i+self.sequence_length])
-            y.append(self.scaler_targets[i+self.sequence_length])
+        features = self._features(df)
+        # If the dataframe is too short for a single window, repeat it just enough to make one
+        if len(features) <= self.sequence_length:
+            logging.warning("Dataframe length (%d) is less than sequence length (%d). Duplicating entries.", len(features), self.sequence_length)
+            features = np.tile(features, (-(-(self.sequence_length + 1) // len(features)), 1))
+
+        # Latitude and longitude are both the first two features and the targets
+        scaled_features = self.scaler_features.fit_transform(features)
+        scaled_targets = self.scaler_targets.fit_transform(features[:, :len(TARGET_COLUMNS)])
+        return scaled_features, scaled_targets
+
+    def prepare_datasets_for_lstm(self, df: pd.DataFrame, batch_size: int = 32, validation_fraction: float = 0.2,
+                                  shuffle_seed: int = 42) -> Tuple[tf.data.Dataset, tf.data.Dataset, np.ndarray, np.ndarray]:
+        """Scale features and build streaming train/validation datasets that cut windows on the fly.
+
+        The split is by time: the last validation_fraction of windows form the validation set. Only the
+        scaled (n, 4) feature array is held in memory. Also returns zero-copy views of the validation windows.
+        """
+        logging.info("Preparing streaming datasets for LSTM with sequence length: %d", self.sequence_length)
+        scaled_features, scaled_targets = self._fit_scalers(df)
+        scaled_features = scaled_features.astype(np.float32)
+        scaled_targets = scaled_targets.astype(np.float32)
+
+        num_windows = len(scaled_features) - self.sequence_length
+        split = int(num_windows * (1 - validation_fraction))
+        # Window i covers features[i:i+sequence_length] and predicts targets[i+sequence_length]
+        data, targets = scaled_features[:-1], scaled_targets[self.sequence_length:]
+        same_device = self._same_device_windows(df)
+        if same_device is not None:
+            # Carry each window's flag as an extra target column, so it survives the shuffle, and drop
+            # the windows spanning two devices from every batch
+            targets = np.column_stack([targets, same_device.astype(np.float32)])
+
+        def drop_mixed(X, y):
+            keep = y[:, -1] > 0
+            return tf.boolean_mask(X, keep), tf.boolean_mask(y[:, :-1], keep)
+
+        datasets = []
+        for extra in ({'shuffle': True, 'seed': shuffle_seed, 'end_index': split + self.sequence_length - 1},
+                      {'start_index': split}):
+            ds = tf.keras.utils.timeseries_dataset_from_array(
+                data, targets, sequence_length=self.sequence_length, batch_size=batch_size, **extra
+            )
+            if same_device is not None:
+                ds = ds.map(drop_mixed)
+            datasets.append(ds.prefetch(tf.data.AUTOTUNE))
+        train_ds, val_ds = datasets
+
+        X, y = sliding_windows(scaled_features, scaled_targets, self.sequence_length)
+        if same_device is not None:
+            X, y, split = X[same_device], y[same_device], int(np.count_nonzero(same_device[:split]))
+        logging.debug("Prepared streaming datasets - train windows: %d, validation windows: %d", split, num_windows - split)
+        return train_ds, val_ds, X[split:], y[split:]
+
+    def prepare_data_for_lstm(self, df: pd.DataFrame, materialize: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Scale features and prepare sequences for LSTM model.
+
+        By default X is a read-only strided view over the scaled feature array, so no per-window
+        copies are made here; model.fit still converts whatever arrays it is given into one tensor,
+        which only the streaming datasets avoid. Pass materialize=True to get an independent,
+        writable copy instead. Dropping the windows that span two devices also makes a copy.
+        """
+        logging.info("Preparing data for LSTM with sequence length: %d", self.sequence_length)
+        scaled_features, scaled_targets = self._fit_scalers(df)
 
-        X = np.array(X)
-        y = np.array(y)
+        X, y = sliding_windows(scaled_features, scaled_targets, self.sequence_length, materialize=materialize)
+        same_device = self._same_device_windows(df)
+        if same_device is not None:
+            X, y = X[same_device], y[same_device]
         logging.debug("Prepared data shapes - X: %s, y: %s", X.shape, y.shape)
         return X, y
 
@@ -106,140 +285,282 @@ class BishopModel:
     def train_model(self, X_train: np.ndarray, y_train: np.ndarray, epochs: int = 200, batch_size: int = 32) -> tf.keras.callbacks.History:
         """Train the model with early stopping and learning rate reduction."""
         logging.info("Starting model training for %d epochs with batch size %d", epochs, batch_size)
-        early_stopping = tf.keras.callbacks.EarlyStopping(patience=20, restore_best_weights=True)
-        reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(factor=0.2, patience=5, min_lr=1e-6)
-
         history = self.model.fit(
             X_train, y_train,
             epochs=epochs,
             batch_size=batch_size,
             validation_split=0.2,
-            callbacks=[early_stopping, reduce_lr],
+            callbacks=self._training_callbacks(),
             verbose=1
         )
         logging.info("Model training completed")
         return history
 
-    # def evaluate_model(self, X_test: np.ndarray, y_test: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    #     """Evaluate the model and calculate various error metrics."""
-    #     logging.info("Evaluating model")
-    #     # Basic evaluation
-    #     test_loss, test_mae = self.model.evaluate(X_test, y_test)
-    #     logging.info("Test Loss: %.4f, Test MAE (scaled): %.4f", test_loss, test_mae)
-
-    #     # Make predictions
-    #     predictions = self.model.predict(X_test)
-    #     predictions = self.scaler_targets.inverse_transform(predictions)
-    #     actual = self.scaler_targets.inverse_transform(y_test)
-
-    #     # Calculate accuracy
-    #     mae = np.mean(np.abs(predictions - actual))
-    #     rmse = np.sqrt(np.mean((predictions - actual)**2))
-    #     logging.info("Mean Absolute Error (degrees): %.4f, Root Mean Square Error (degrees): %.4f", mae, rmse)
-        
-    #     # Calculate error in kilometers
-    #     errors_km = self.haversine_distance(actual[:, 0], actual[:, 1], predictions[:, 0], predictions[:, 1])
-    #     mae_km = np.mean(errors_km)
-    #     rmse_km = np.sqrt(np.mean(errors_km**2))
-    #     logging.info("Mean Absolute Error (km): %.4f, Root Mean Square Error (km): %.4f", mae_km, rmse_km)
-        
-    #     return predictions, actual
-
-    def predict(self, prediction_request: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Predict coordinates for each prediction request."""
-        logging.info("Predicting coordinates for %d requests", len(prediction_request))
-        if not hasattr(self.scaler_features, 'data_min_') or not hasattr(self.scaler_targets, 'data_min_'):
-            logging.error("Scalers are not fitted. Train the model first or load the scalers.")
-            raise ValueError("Scalers are not fitted. Train the model first or load the scalers.")
-
-        results = []
-        for req in prediction_request:
-            # Extract timestamp and current coordinates
-            timestamp = pd.to_datetime(req["timestamp"])
-            current_coords = (req["current_lat"], req["current_long"])
-
-            # Create a DataFrame for the single request
-            df = pd.DataFrame({
-                'timestamp': [timestamp],
-                'latitude': [current_coords[0]],
-                'longitude': [current_coords[1]]
-            })
-
-            # Add time features
-            df = self.add_time_features(df)
-
-            # Scale features
-            predict_scaled_features = self.scaler_features.transform(df[['latitude', 'longitude', 'minute_of_day', 'day_of_week']])
-
-            # Ensure the input has the correct shape for LSTM
-            if len(predict_scaled_features) < self.sequence_length:
-                logging.warning("Input data length (%d) is less than sequence length (%d). Padding input.", 
-                                len(predict_scaled_features), self.sequence_length)
-                padding = np.zeros((self.sequence_length - len(predict_scaled_features), predict_scaled_features.shape[1]))
-                predict_scaled_features = np.vstack([padding, predict_scaled_features])
-            else:
-                predict_scaled_features = predict_scaled_features[-self.sequence_length:]
+    def train_model_on_dataset(self, train_ds: tf.data.Dataset, val_ds: tf.data.Dataset, epochs: int = 200) -> tf.keras.callbacks.History:
+        """Train the model from streaming datasets with early stopping and learning rate reduction."""
+        logging.info("Starting streaming model training for %d epochs", epochs)
+        history = self.model.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=epochs,
+            callbacks=self._training_callbacks(),
+            verbose=1
+        )
+        logging.info("Model training completed")
+        return history
 
-            X = np.expand_dims(predict_scaled_features, axis=0)  # Reshape to (1, sequence_length, num_features)
-            logging.debug("Prepared input for prediction: %s", X.shape)
+    @staticmethod
+    def _training_callbacks() -> List[tf.keras.callbacks.Callback]:
+        early_stopping = tf.keras.callbacks.EarlyStopping(patience=20, restore_best_weights=True)
+        reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(factor=0.2, patience=5, min_lr=1e-6)
+        return [early_stopping, reduce_lr, BishopModel._epoch_timer()]
 
-            # Make prediction
-            predictions = self.model.predict(X)
-            predicted_coordinates = self.scaler_targets.inverse_transform(predictions)
+    @staticmethod
+    def _epoch_timer() -> tf.keras.callbacks.Callback:
+        """Record each epoch's wall time under the training_epoch stage."""
+        started = {}
+        return tf.keras.callbacks.LambdaCallback(
+            on_epoch_begin=lambda epoch, logs: started.__setitem__(epoch, time.perf_counter()),
+            on_epoch_end=lambda epoch, logs: STAGE_SECONDS.observe("training_epoch", time.perf_counter() - started.pop(epoch))
+        )
 
-            # Append result for this request
-            results.append({
-                "timestamp": timestamp.isoformat(),
-                "predicted_lat": float(predicted_coordinates[0][0]),  # Convert to native float
-                "predicted_long": float(predicted_coordinates[0][1])  # Convert to native float
-            })
+    def evaluate_model(self, X_test: np.ndarray, y_test: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Evaluate the model on scaled test windows and log the error in degrees and kilometers.
+
+        Returns the unscaled predictions and actual positions.
+        """
+        logging.info("Evaluating model")
+        self._ensure_model()
+        test_loss, test_mae = self.model.evaluate(X_test, y_test, verbose=0)
+        logging.info("Test Loss: %.4f, Test MAE (scaled): %.4f", test_loss, test_mae)
+
+        predictions = unscale(self.model.predict(X_test, verbose=0), self.scaler_targets)
+        actual = unscale(y_test, self.scaler_targets)
+
+        mae = np.mean(np.abs(predictions - actual))
+        rmse = np.sqrt(np.mean((predictions - actual)**2))
+        logging.info("Mean Absolute Error (degrees): %.4f, Root Mean Square Error (degrees): %.4f", mae, rmse)
+
+        errors_km = self.haversine_distance(actual[:, 0], actual[:, 1], predictions[:, 0], predictions[:, 1])
+        mae_km = np.mean(errors_km)
+        rmse_km = np.sqrt(np.mean(errors_km**2))
+        logging.info("Mean Absolute Error (km): %.4f, Root Mean Square Error (km): %.4f", mae_km, rmse_km)
+
+        return predictions, actual
+
+    def options(self) -> Dict[str, Any]:
+        return {'sequence_length': self.sequence_length, 'compress': self.compress, 'epochs': self.epochs,
+                'streaming': self.streaming}
+
+    @property
+    def context_span(self) -> Optional[pd.Timedelta]:
+        # Compressed training rows are GRID_FREQ apart, so fine-tuning context is a span of time, not a row count
+        return GRID_FREQ * self.sequence_length if self.compress else None
+
+    def _training_rows(self, raw_df: pd.DataFrame) -> pd.DataFrame:
+        """Rows to cut windows from, oldest first. With a device_id column, device by device."""
+        if 'device_id' not in raw_df.columns:
+            if self.compress:
+                return preprocess_fixes(raw_df)
+            return raw_df.sort_values('timestamp', ignore_index=True, kind='stable')
+        # One device's fixes must not be averaged into, or interpolated towards, another's
+        devices = []
+        for device_id, fixes in raw_df.groupby(raw_df['device_id'].fillna(DEFAULT_DEVICE), sort=True):
+            fixes = fixes[['timestamp', 'latitude', 'longitude']]
+            rows = preprocess_fixes(fixes) if self.compress else fixes.sort_values('timestamp', kind='stable')
+            devices.append(rows.assign(device_id=device_id))
+        return pd.concat(devices, ignore_index=True)
+
+    def _same_device_windows(self, rows: pd.DataFrame) -> Optional[np.ndarray]:
+        """Per window of _training_rows' rows, whether its inputs and target are one device's. None without devices."""
+        # Frames too short for a window are tiled by _fit_scalers, and windows within one device are moot
+        if 'device_id' not in rows.columns or len(rows) <= self.sequence_length:
+            return None
+        # Each device's rows are contiguous, so a window is one device's when its ends are
+        devices = rows['device_id'].to_numpy()
+        return devices[:-self.sequence_length] == devices[self.sequence_length:]
+
+    def _check_trained(self) -> None:
+        if not hasattr(self.scaler_features, 'data_min_') or not hasattr(self.scaler_targets, 'data_min_'):
+            logging.error("Scalers are not fitted. Train the model first or load the scalers.")
+            raise ValueError("Scalers are not fitted. Train the model first or load the scalers.")
 
-        logging.info("Prediction completed for all requests")
-        return results
+    def _forward(self, prediction_request: List[Dict[str, Any]], timestamps: List[pd.Timestamp]) -> np.ndarray:
+        """Run one forward pass over the requests and return unscaled (lat, lon) rows."""
+        X = sequence_inputs(
+            timestamps,
+            [req["current_lat"] for req in prediction_request],
+            [req["current_long"] for req in prediction_request],
+            [req.get("device_id", DEFAULT_DEVICE) for req in prediction_request],
+            self.history, self.sequence_length, self.scaler_features, cache=self.feature_cache
+        )
+        logging.debug("Prepared input for prediction: %s", X.shape)
 
-    @staticmethod
-    def haversine_distance(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
-        """Calculate distance between two points on Earth using Haversine formula."""
-        R = 6371  # Earth's radius in kilometers
+        # Make prediction
+        with stage_timer("forward"):
+            if self.model is None and self._pending_weights is not None:
+                predictions = lstm_forward(self._pending_weights, X)
+            else:
+                self._ensure_model()
+                predictions = self.model.predict(X, verbose=0)
+        return unscale(predictions, self.scaler_targets)
 
-        lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    haversine_distance = staticmethod(haversine_distance)
 
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+    def process_and_train(self, raw_df: pd.DataFrame, streaming: Optional[bool] = None) -> Tuple[np.ndarray, np.ndarray, tf.keras.callbacks.History]:
+        """Process data and train the model without evaluation.
 
-        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+        With streaming (the model's own setting unless given), windows are generated on the fly by
+        a tf.data pipeline instead of being passed to fit as arrays, which Keras copies whole.
+        Either way the hold-out set is the most recent 20% of windows.
+        """
+        logging.info("Processing raw data and training the model")
+        df = self._training_rows(raw_df)
 
-        return R * c
+        if self.streaming if streaming is None else streaming:
+            train_ds, val_ds, X_test, y_test = self.prepare_datasets_for_lstm(df)
+            self.build_lstm_model()
+            history = self.train_model_on_dataset(train_ds, val_ds, epochs=self.epochs)
+            self._mark_full_train(raw_df)
+            logging.info("Model training process completed")
+            return X_test, y_test, history
 
-    def process_and_train(self, raw_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, tf.keras.callbacks.History]:
-        """Process data and train the model without evaluation."""
-        logging.info("Processing raw data and training the model")
-        # Add time features
-        df = self.add_time_features(raw_df)
-        
         # Prepare data
         X, y = self.prepare_data_for_lstm(df)
-    
 
-        # Split data
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
+        # Split by time with slices, which keep X a view; a shuffled split would copy every window
+        split = int(len(X) * 0.8)
+        X_train, X_test, y_train, y_test = X[:split], X[split:], y[:split], y[split:]
         logging.debug("Data split into training and testing sets")
-        self.scaler_features = MinMaxScaler().fit(df[['latitude', 'longitude', 'minute_of_day', 'day_of_week']])
-        self.scaler_targets = MinMaxScaler().fit(df[['latitude', 'longitude']])
-    
 
         # Build and train model
         self.build_lstm_model()
-        history = self.train_model(X_train, y_train)
+        history = self.train_model(X_train, y_train, epochs=self.epochs)
+        self._mark_full_train(raw_df)
         logging.info("Model training process completed")
         return X_test, y_test, history
 
+    def fine_tune(self, raw_df: pd.DataFrame, epochs: int = 5, batch_size: int = 32,
+                  learning_rate: float = 1e-4) -> Optional[tf.keras.callbacks.History]:
+        """Continue training the current weights on rows newer than the trained_until watermark.
+
+        raw_df should include the rows before the watermark that the first new windows need as context:
+        sequence_length rows, or context_span of time when compressing. Scalers are kept as they are;
+        use detect_drift to decide when they no longer fit.
+        """
+        self._ensure_model()
+        if self.model is None or self.trained_until is None:
+            raise ValueError("Model has not been trained yet. Run process_and_train first.")
+        df = self._training_rows(raw_df)
+
+        features = self._features(df)
+        scaled_features = scale(features, self.scaler_features)
+        scaled_targets = scale(features[:, :len(TARGET_COLUMNS)], self.scaler_targets)
+        X, y = sliding_windows(scaled_features, scaled_targets, self.sequence_length)
+        # Only windows whose target is new data contribute
+        is_new = (df['timestamp'] > self.trained_until).to_numpy()[self.sequence_length:]
+        same_device = self._same_device_windows(df)
+        if same_device is not None:
+            is_new = is_new & same_device
+        X, y = X[is_new], y[is_new]
+        if len(X) == 0:
+            logging.info("No new windows after %s, skipping fine-tuning", self.trained_until)
+            return None
+
+        logging.info("Fine-tuning on %d new windows for %d epochs", len(X), epochs)
+        self.model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+                           loss='mse',
+                           metrics=['mae'])
+        history = self.model.fit(X, y, epochs=epochs, batch_size=batch_size, verbose=1)
+        self.trained_until = pd.to_datetime(raw_df['timestamp']).max()
+        logging.info("Fine-tuning completed, watermark now %s", self.trained_until)
+        return history
+
+    def detect_drift(self, raw_df: pd.DataFrame, threshold: float = 0.1) -> bool:
+        """True when more than threshold of the fixes fall outside the coordinate range the scalers were fit on."""
+        scaled = scale(raw_df[TARGET_COLUMNS].to_numpy(dtype=np.float64), self.scaler_targets)
+        outside = np.mean(np.any((scaled < 0) | (scaled > 1), axis=1))
+        logging.debug("%.1f%% of %d fixes fall outside the fitted coordinate range", outside * 100, len(raw_df))
+        return bool(outside > threshold)
+
+    def save_model(self, base_path: str) -> str:
+        """Save weights, both scalers and metadata into base_path. Returns base_path."""
+        logging.info("Saving model version %d to %s", self.version, base_path)
+        base_path = os.path.expanduser(base_path)
+        weights_dir = os.path.join(base_path, 'weights')
+        os.makedirs(weights_dir, exist_ok=True)
+        self._ensure_model()
+        # Weights are stored as plain .npy files so they can be memory-mapped on load
+        for i, weights in enumerate(self.model.get_weights()):
+            np.save(os.path.join(weights_dir, f'{i:03d}.npy'), weights)
+        with open(os.path.join(base_path, 'scalers.pkl'), 'wb') as f:
+            pickle.dump({'features': self.scaler_features, 'targets': self.scaler_targets}, f)
+        self._save_meta(base_path, sequence_length=self.sequence_length, compress=self.compress, epochs=self.epochs,
+                        streaming=self.streaming)
+        return base_path
+
+    @classmethod
+    def load_model(cls, base_path: str, history: Optional[HistoryBuffer] = None, mmap: bool = False,
+                   build: bool = True) -> 'BishopModel':
+        """Rebuild a BishopModel from a directory written by save_model.
+
+        build=False skips the Keras model: predictions then run on the loaded arrays with
+        lstm_forward, without TensorFlow, and the model is only built when training needs it. With
+        mmap=True as well, the weight files are memory-mapped, so every process serving the
+        snapshot shares one copy of them through the page cache. Building the Keras model copies
+        the weights into per-process TensorFlow variables.
+        """
+        base_path = os.path.expanduser(base_path)
+        meta = cls._read_meta(base_path)
+        bishop_model = cls(sequence_length=meta['sequence_length'], history=history, compress=meta.get('compress', True),
+                           epochs=meta.get('epochs', 200), streaming=meta.get('streaming', True))
+        bishop_model._apply_meta(meta)
+        with open(os.path.join(base_path, 'scalers.pkl'), 'rb') as f:
+            scalers = pickle.load(f)
+        bishop_model.scaler_features = scalers['features']
+        bishop_model.scaler_targets = scalers['targets']
+
+        weights_dir = os.path.join(base_path, 'weights')
+        weights = [np.load(os.path.join(weights_dir, name), mmap_mode='r' if mmap else None)
+                   for name in sorted(os.listdir(weights_dir))]
+        bishop_model._pending_weights = weights
+        if build:
+            bishop_model._ensure_model()
+        logging.info("Loaded model version %d from %s", bishop_model.version, base_path)
+        return bishop_model
+
+    def _ensure_model(self) -> None:
+        """Build the Keras model from weights deferred by load_model, if any."""
+        if self.model is None and self._pending_weights is not None:
+            self.build_lstm_model()
+            self.model.set_weights(self._pending_weights)
+            self._pending_weights = None
+
+    def warm_up(self) -> None:
+        """Make the first predict as fast as the rest.
+
+        Unbuilt snapshots run one NumPy forward pass, which pages the weights in. A built Keras
+        model is traced for two batch sizes, which makes TensorFlow retrace with the batch
+        dimension left open, so the coalescer's batches of any size reuse that trace.
+        """
+        if self.model is None and self._pending_weights is not None:
+            lstm_forward(self._pending_weights, np.zeros((1, self.sequence_length, self._pending_weights[0].shape[0])))
+        elif self.model is not None:
+            for batch_size in (1, 2):
+                self.model.predict(np.zeros((batch_size,) + tuple(self.model.input_shape[1:])), verbose=0)
+
+    def nbytes(self) -> int:
+        """Size of the model's weights in bytes, whether or not the Keras model has been built."""
+        if self._pending_weights is not None:
+            return sum(w.nbytes for w in self._pending_weights)
+        if self.model is not None:
+            return sum(w.nbytes for w in self.model.get_weights())
+        return 0
+
 def main() -> None:
     logging.info("Starting main function")
     # Generate raw data
-    raw_df = generate_synthetic_data()
+    raw_df = generate_synthetic_data(seed=42)
     
     # Create model and process data
     bishop_model = BishopModel(sequence_length=144)  # 24 hours of data (144 * 10 minutes)
@@ -0,0 +1,70 @@
+"""Import-time regression check for the model server.
+
+Imports server.py in a fresh interpreter with -X importtime, prints the slowest imports and
+exits non-zero if a heavy dependency is loaded eagerly or the import exceeds the time budget.
+
+Usage: python check_import_time.py [--budget-seconds 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Only needed on specific code paths; importing any of them at startup is a regression
+HEAVY_MODULES = [
+    "tensorflow",
+    "prophet",
+    "faker",
+    "sklearn",
+    "google.cloud.bigquery",
+    "google.cloud.storage",
+    "influxdb_client",
+]
+
+
+def profile_server_import():
+    """Return ({module: cumulative microseconds}, total microseconds) for `import server`."""
+    env = dict(os.environ)
+    env.setdefault("COORDINATES_CRON", "300")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("Importing server failed")
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, times = line.split(":", 1)
+        _, total, name = (part.strip() for part in times.split("|"))
+        cumulative[name] = int(total)
+    return cumulative, cumulative.get("server", 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    cumulative, total = profile_server_import()
+    top_level = {name: us for name, us in cumulative.items() if "." not in name}
+    print(f"import server: {total / 1e6:.2f}s")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:15]:
+        print(f"  {us / 1e6:8.3f}s  {name}")
+
+    failures = [f"{name} is imported at startup" for name in HEAVY_MODULES if name in cumulative]
+    if total > args.budget_seconds * 1e6:
+        failures.append(f"import took {total / 1e6:.2f}s, budget is {args.budget_seconds:.2f}s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
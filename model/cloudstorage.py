@@ -1,7 +1,10 @@
-from google.cloud import storage
+from lazy import lazy_import
 import os
+import shutil
 import logging
 
+storage = lazy_import("google.cloud.storage")
+
 class CloudStorageI:
     def __init__(self, bucket_name: str):
         logging.info(CloudStorageI.__name__,"Env var", os.getenv("ENVIRONMENT"))
@@ -28,4 +31,54 @@ class CloudStorageI:
             blob.download_to_filename(destination_file_path)
             print(CloudStorageI.__name__,f"File {source_blob_name} downloaded to {destination_file_path}.")
         except Exception as e:
-            print(CloudStorageI.__name__,f"Error downloading file: {e}")
\ No newline at end of file
+            print(CloudStorageI.__name__,f"Error downloading file: {e}")
+
+    def list_files(self, prefix: str):
+        try:
+            return [blob.name for blob in self.client.list_blobs(self.bucket_name, prefix=prefix)]
+        except Exception as e:
+            print(CloudStorageI.__name__,f"Error listing files: {e}")
+            return []
+
+    def delete_file(self, blob_name: str):
+        try:
+            self.bucket.blob(blob_name).delete()
+            print(CloudStorageI.__name__, f"File {blob_name} deleted.")
+        except Exception as e:
+            print(CloudStorageI.__name__,f"Error deleting file: {e}")
+
+class LocalStorageI:
+    """Filesystem stand-in for CloudStorageI, with the same upload/download/list/delete interface."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.expanduser(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def upload_file(self, source_file_path: str, destination_blob_name: str):
+        try:
+            destination = os.path.join(self.root_dir, destination_blob_name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(source_file_path, destination)
+        except Exception as e:
+            print(LocalStorageI.__name__, f"Error uploading file: {e}")
+
+    def download_file(self, source_blob_name: str, destination_file_path: str):
+        try:
+            shutil.copyfile(os.path.join(self.root_dir, source_blob_name), destination_file_path)
+        except Exception as e:
+            print(LocalStorageI.__name__, f"Error downloading file: {e}")
+
+    def list_files(self, prefix: str):
+        names = []
+        for directory, _, files in os.walk(self.root_dir):
+            for name in files:
+                blob_name = os.path.relpath(os.path.join(directory, name), self.root_dir).replace(os.sep, "/")
+                if blob_name.startswith(prefix):
+                    names.append(blob_name)
+        return sorted(names)
+
+    def delete_file(self, blob_name: str):
+        try:
+            os.remove(os.path.join(self.root_dir, blob_name))
+        except Exception as e:
+            print(LocalStorageI.__name__, f"Error deleting file: {e}")
@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+PredictFn = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+LookupFn = Callable[[List[Dict[str, Any]]], List[Optional[Dict[str, Any]]]]
+
+
+class _Pending:
+    """One caller's prediction_request waiting for its slice of a batch."""
+
+    def __init__(self, prediction_request: List[Dict[str, Any]]):
+        self.prediction_request = prediction_request
+        self.results: Optional[List[Dict[str, Any]]] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class PredictCoalescer:
+    """Merges concurrent predict calls into micro-batches that share a single forward pass.
+
+    A batch closes window_ms after its first request arrives, or as soon as it holds
+    max_batch_size prediction items, whichever comes first. lookup_fn, when given, runs in the
+    caller's thread first and returns a result or None per item; only the items it has no
+    result for wait for a batch, so cache hits do not wait out the window.
+    """
+
+    def __init__(self, predict_fn: PredictFn, window_ms: float = 5.0, max_batch_size: int = 64,
+                 lookup_fn: Optional[LookupFn] = None):
+        self.predict_fn = predict_fn
+        self.lookup_fn = lookup_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._items = 0
+        self._max_batch_items = 0
+        self._max_queue_depth = 0
+        self._looked_up = 0
+
+    def start(self) -> None:
+        """Start the batching thread if it is not already running."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="predict-coalescer", daemon=True)
+                self._thread.start()
+
+    def predict(self, prediction_request: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Predict for one caller, sharing the forward pass with any concurrent callers."""
+        if not prediction_request:
+            return []
+        results = self.lookup_fn(prediction_request) if self.lookup_fn is not None else [None] * len(prediction_request)
+        missing = [i for i, result in enumerate(results) if result is None]
+        with self._stats_lock:
+            self._looked_up += len(prediction_request) - len(missing)
+        if not missing:
+            return results
+
+        self.start()
+        pending = _Pending([prediction_request[i] for i in missing])
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        for i, result in zip(missing, pending.results):
+            results[i] = result
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "requests": self._requests,
+                "items": self._items,
+                "mean_batch_items": self._items / self._batches if self._batches else 0.0,
+                "mean_batch_requests": self._requests / self._batches if self._batches else 0.0,
+                "max_batch_items": self._max_batch_items,
+                "looked_up_items": self._looked_up,
+            }
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            items = len(first.prediction_request)
+            deadline = time.monotonic() + self.window
+            while items < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                items += len(pending.prediction_request)
+
+            self._record(batch, items)
+            self._execute(batch)
+
+    def _record(self, batch: List[_Pending], items: int) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._items += items
+            self._max_batch_items = max(self._max_batch_items, items)
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize() + len(batch))
+
+    def _execute(self, batch: List[_Pending]) -> None:
+        try:
+            results = self.predict_fn([item for pending in batch for item in pending.prediction_request])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+                batch[0].done.set()
+                return
+            # Re-run callers one by one so a single bad request only fails its own caller
+            logging.warning("Batched prediction of %d requests failed, retrying individually", len(batch))
+            for pending in batch:
+                self._execute([pending])
+            return
+
+        offset = 0
+        for pending in batch:
+            count = len(pending.prediction_request)
+            pending.results = results[offset:offset + count]
+            offset += count
+            pending.done.set()
+
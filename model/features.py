@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from historybuffer import HistoryBuffer
+from metrics import stage_timer
+
+FEATURE_COLUMNS = ['latitude', 'longitude', 'minute_of_day', 'day_of_week']
+TARGET_COLUMNS = ['latitude', 'longitude']
+
+MINUTES_PER_DAY = 24 * 60
+NS_PER_MINUTE = 60 * 1_000_000_000
+# 1970-01-01 was a Thursday, day 3 counting from Monday as pandas does
+EPOCH_DAY_OF_WEEK = 3
+
+
+def epoch_ns(timestamps) -> np.ndarray:
+    """Timestamps as int64 nanoseconds since the epoch, in UTC. Naive timestamps are taken to be UTC.
+
+    Accepts datetime64 arrays, datetime Series or indexes (tz-aware or not), or any sequence of
+    values pd.Timestamp understands, e.g. ISO strings with mixed offsets.
+    """
+    if isinstance(timestamps, np.ndarray) and timestamps.dtype.kind == 'M':
+        return timestamps.astype('datetime64[ns]').view(np.int64)
+    if isinstance(timestamps, (pd.Series, pd.Index)) and timestamps.dtype.kind == 'M':
+        return pd.DatetimeIndex(timestamps).as_unit('ns').asi8
+    return np.fromiter((pd.Timestamp(t).value for t in timestamps), dtype=np.int64, count=len(timestamps))
+
+
+def time_features(timestamps) -> Tuple[np.ndarray, np.ndarray]:
+    """(minute_of_day, day_of_week) in UTC for each timestamp, Monday being 0."""
+    minutes = epoch_ns(timestamps) // NS_PER_MINUTE
+    return minutes % MINUTES_PER_DAY, (minutes // MINUTES_PER_DAY + EPOCH_DAY_OF_WEEK) % 7
+
+
+def build_features(timestamps, latitudes, longitudes) -> np.ndarray:
+    """The (n, 4) float feature matrix in FEATURE_COLUMNS order. Used for training and prediction alike."""
+    minute_of_day, day_of_week = time_features(timestamps)
+    return np.column_stack([
+        np.asarray(latitudes, dtype=np.float64),
+        np.asarray(longitudes, dtype=np.float64),
+        minute_of_day.astype(np.float64),
+        day_of_week.astype(np.float64),
+    ])
+
+
+def scale(values: np.ndarray, scaler: Any) -> np.ndarray:
+    """MinMaxScaler.transform without sklearn's per-call input validation."""
+    return values * scaler.scale_ + scaler.min_
+
+
+def unscale(values: np.ndarray, scaler: Any) -> np.ndarray:
+    """MinMaxScaler.inverse_transform without sklearn's per-call input validation."""
+    return (values - scaler.min_) / scaler.scale_
+
+
+class FeatureCache:
+    """Scaled history rows per device, reused across predict calls until the device records new fixes.
+
+    Entries are only valid for the scaler they were computed with, so each model snapshot owns one.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Tuple[int, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, device_id: Hashable, revision: int) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None or entry[0] != revision:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(device_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, device_id: Hashable, revision: int, rows: np.ndarray) -> None:
+        with self._lock:
+            self._entries[device_id] = (revision, rows)
+            self._entries.move_to_end(device_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def scaled_history(history: HistoryBuffer, device_id: Hashable, length: int, scaler: Any,
+                   cache: Optional[FeatureCache] = None) -> np.ndarray:
+    """Up to `length` of the device's most recent history rows, scaled, oldest first."""
+    revision = history.revision(device_id)
+    if cache is not None:
+        rows = cache.get(device_id, revision)
+        if rows is not None:
+            return rows
+    rows = history.window(device_id)[-length:] if length > 0 else np.empty((0, history.num_features))
+    rows = scale(rows, scaler) if len(rows) else rows
+    if cache is not None:
+        cache.put(device_id, revision, rows)
+    return rows
+
+
+def sequence_inputs(timestamps, latitudes, longitudes, device_ids: Sequence[Hashable], history: HistoryBuffer,
+                    sequence_length: int, scaler: Any, cache: Optional[FeatureCache] = None) -> np.ndarray:
+    """(n, sequence_length, 4) LSTM inputs for n requested positions.
+
+    Each window is the device's recent trajectory followed by the requested timestep. Devices
+    without enough history are left-padded with zeros up to the sequence length.
+    """
+    with stage_timer("features"):
+        features = build_features(timestamps, latitudes, longitudes)
+    with stage_timer("scaling"):
+        requested = scale(features, scaler)
+        windows = {}
+        for device_id in device_ids:
+            if device_id not in windows:
+                windows[device_id] = scaled_history(history, device_id, sequence_length - 1, scaler, cache)
+    X = np.zeros((len(requested), sequence_length, requested.shape[1]))
+    X[:, -1, :] = requested
+    for i, device_id in enumerate(device_ids):
+        rows = windows[device_id]
+        if len(rows):
+            X[i, -1 - len(rows):-1, :] = rows
+    return X
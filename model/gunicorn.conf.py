@@ -0,0 +1,71 @@
+"""Production serving: gunicorn -c gunicorn.conf.py server:app
+
+The app is imported once in the master, which loads no model, so workers start answering right
+away. Each worker loads the published snapshot in a background thread; until it is done
+/model/health reports model_ready false and predictions get a 503. Workers memory-map the
+snapshot's weight files and predict from them with NumPy (bishopmodel.lstm_forward) instead of
+building a Keras model, so every worker shares one copy of the weights through the page cache
+and serving never starts TensorFlow. TensorFlow only runs in the training processes. Thread
+pools are sized through the environment, so the workers together do not oversubscribe the
+cores. Exactly one worker runs the APScheduler training job; the others poll for the snapshots
+it publishes.
+
+Some state is still kept per worker process: the latest position per device, the rolling
+history that forms LSTM input windows, and the prediction cache. A fix inserted through one
+worker is not seen by the others, so the same request can get different answers depending on
+the worker that serves it. Until that state is shared, run one worker (the default) and scale
+with threads and instances. With more workers /model/coordinates/last re-checks BigQuery once a
+device's entry is LAST_POSITION_MAX_AGE_SECONDS old, 60 unless set.
+"""
+import fcntl
+import importlib
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# One worker by default, see above
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Threads let concurrent requests inside a worker share forward passes through the coalescer
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+timeout = 120
+
+# Read when NumPy's BLAS and TensorFlow start, so set here before the app is imported. Training
+# processes are spawned from the workers and inherit them
+_cores_per_worker = str(max(1, multiprocessing.cpu_count() // workers))
+for _name, _default in (("OMP_NUM_THREADS", _cores_per_worker), ("OPENBLAS_NUM_THREADS", _cores_per_worker),
+                        ("TF_NUM_INTRAOP_THREADS", os.getenv("TF_INTRA_OP_THREADS", _cores_per_worker)),
+                        ("TF_NUM_INTEROP_THREADS", os.getenv("TF_INTER_OP_THREADS", "1"))):
+    os.environ.setdefault(_name, _default)
+if workers > 1:
+    # Single workers see every fix they serve and never re-check, see server.py
+    os.environ.setdefault("LAST_POSITION_MAX_AGE_SECONDS", "60")
+
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", "/tmp/bishop-scheduler.lock")
+_scheduler_lock = None
+
+
+def _acquire_scheduler_lock():
+    """Return True in the first worker to take the lock. It is released when that worker exits."""
+    global _scheduler_lock
+    lock_file = open(SCHEDULER_LOCK_PATH, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _scheduler_lock = lock_file
+    return True
+
+
+def when_ready(server):
+    if workers > 1:
+        server.log.warning("Running %d workers: latest positions and LSTM history are kept per worker and can "
+                           "differ between them", workers)
+
+
+def post_fork(server, worker):
+    run_scheduler = _acquire_scheduler_lock()
+    server.log.info("Worker %s %s the training scheduler", worker.pid, "runs" if run_scheduler else "does not run")
+    importlib.import_module("server").start_worker(run_scheduler=run_scheduler)
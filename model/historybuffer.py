@@ -0,0 +1,141 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DEVICE = "default"
+
+
+def _naive_utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_convert('UTC').tz_localize(None) if timestamp.tzinfo is not None else timestamp
+
+
+class _Ring:
+    """Fixed-capacity ring of feature rows for a single device."""
+
+    def __init__(self, capacity: int, num_features: int):
+        self.rows = np.zeros((capacity, num_features))
+        self.next_index = 0
+        self.count = 0
+        self.last_timestamp: Optional[pd.Timestamp] = None
+        # How many observations were averaged into the newest row
+        self.last_count = 0
+        # Newest raw observation seen, when rows are binned and so stamped earlier than it
+        self.observed_until: Optional[pd.Timestamp] = None
+        # Changes whenever the window does
+        self.revision = 0
+
+    def push(self, rows: np.ndarray) -> None:
+        capacity = len(self.rows)
+        rows = rows[-capacity:]
+        positions = (self.next_index + np.arange(len(rows))) % capacity
+        self.rows[positions] = rows
+        self.next_index = (self.next_index + len(rows)) % capacity
+        self.count = min(self.count + len(rows), capacity)
+        self.revision += len(rows)
+
+    def merge_last(self, total: np.ndarray, count: int) -> None:
+        """Average count more observations, summing to total, into the newest row."""
+        index = (self.next_index - 1) % len(self.rows)
+        self.rows[index] = (self.rows[index] * self.last_count + total) / (self.last_count + count)
+        self.last_count += count
+        self.revision += 1
+
+    def ordered(self) -> np.ndarray:
+        if self.count < len(self.rows):
+            return self.rows[:self.count].copy()
+        return np.roll(self.rows, -self.next_index, axis=0)
+
+
+class HistoryBuffer:
+    """In-memory rolling window of the most recent unscaled feature rows, keyed by device.
+
+    The buffer lives in one process. Under gunicorn each worker has its own, filled only by the
+    inserts that worker handles (and, in the scheduler worker, by training fetches).
+    """
+
+    def __init__(self, sequence_length: int, num_features: int = 4):
+        self.sequence_length = sequence_length
+        self.num_features = num_features
+        self._rings: Dict[str, _Ring] = {}
+        self._lock = threading.Lock()
+
+    def extend(self, device_id: str, timestamps: pd.Series, features: np.ndarray,
+               observed_until: Optional[pd.Timestamp] = None) -> int:
+        """Append feature rows not older than the last buffered timestamp. Returns the number of rows added.
+
+        Rows sharing a timestamp, including the newest buffered one, are averaged into a single row,
+        so observations binned onto a grid step make one row per step. Callers that bin pass the
+        newest raw observation as observed_until; see observed_until().
+        """
+        timestamps = pd.to_datetime(pd.Series(timestamps)).reset_index(drop=True)
+        if timestamps.dt.tz is not None:
+            # Compare everything as naive UTC so BigQuery rows and local inserts interleave correctly
+            timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+        timestamps = timestamps.astype('datetime64[ns]')
+        features = np.asarray(features, dtype=float).reshape(-1, self.num_features)
+        order = np.argsort(timestamps.to_numpy(), kind='stable')
+        timestamps, features = timestamps.iloc[order], features[order]
+
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                ring = self._rings[device_id] = _Ring(self.sequence_length, self.num_features)
+            if observed_until is not None:
+                observed_until = _naive_utc(observed_until)
+                if ring.observed_until is None or observed_until > ring.observed_until:
+                    ring.observed_until = observed_until
+            if ring.last_timestamp is not None:
+                current = (timestamps >= ring.last_timestamp).to_numpy()
+                timestamps, features = timestamps[current], features[current]
+            if len(features) == 0:
+                return 0
+
+            values = timestamps.to_numpy()
+            starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+            counts = np.diff(np.append(starts, len(values)))
+            totals = np.add.reduceat(features, starts, axis=0)
+            steps = timestamps.iloc[starts]
+            if ring.last_timestamp is not None and steps.iloc[0] == ring.last_timestamp:
+                ring.merge_last(totals[0], counts[0])
+                totals, counts, steps = totals[1:], counts[1:], steps.iloc[1:]
+            if len(totals):
+                ring.push(totals / counts[:, None])
+                ring.last_timestamp = steps.iloc[-1]
+                ring.last_count = int(counts[-1])
+        return len(totals)
+
+    def last(self, device_id: str) -> Optional[Tuple[pd.Timestamp, np.ndarray]]:
+        """The newest buffered row and its timestamp (naive UTC), or None for unknown devices."""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None or ring.count == 0:
+                return None
+            return ring.last_timestamp, ring.rows[(ring.next_index - 1) % len(ring.rows)].copy()
+
+    def observed_until(self, device_id: str) -> Optional[pd.Timestamp]:
+        """Newest raw observation recorded for the device: the one given to extend, else the newest row's timestamp."""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                return None
+            return ring.observed_until if ring.observed_until is not None else ring.last_timestamp
+
+    def window(self, device_id: str) -> np.ndarray:
+        """Return the buffered rows for a device, oldest first. Empty if the device is unknown."""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                return np.empty((0, self.num_features))
+            return ring.ordered()
+
+    def revision(self, device_id: str) -> int:
+        """A counter that changes whenever the device's window does. 0 for unknown devices."""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            return ring.revision if ring is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._rings)
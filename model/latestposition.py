@@ -0,0 +1,51 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+
+def _utc(timestamp) -> pd.Timestamp:
+    """Parse a timestamp, treating naive values as UTC the way BigQuery does."""
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+
+class LatestPositionStore:
+    """Authoritative in-memory latest fix per device.
+
+    Rows have the same shape as BigQueryI.fetch_recent_data results (id, timestamp, coordinates).
+    An entry is stale once max_age seconds pass without this process writing or confirming it,
+    which is when callers should re-check BigQuery in case another instance wrote something newer.
+    """
+
+    def __init__(self, max_age: Optional[float] = None):
+        self.max_age = max_age
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._timestamps: Dict[str, pd.Timestamp] = {}
+        self._confirmed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_id: str, row: Dict[str, Any]) -> bool:
+        """Record row as the device's latest fix unless a newer one is already held. Returns True if stored."""
+        timestamp = _utc(row["timestamp"])
+        with self._lock:
+            self._confirmed_at[device_id] = time.monotonic()
+            current = self._timestamps.get(device_id)
+            if current is not None and current >= timestamp:
+                return False
+            self._rows[device_id] = dict(row)
+            self._timestamps[device_id] = timestamp
+            return True
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._rows.get(device_id)
+            return dict(row) if row is not None else None
+
+    def is_stale(self, device_id: str) -> bool:
+        with self._lock:
+            confirmed_at = self._confirmed_at.get(device_id)
+        if confirmed_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - confirmed_at > self.max_age
@@ -0,0 +1,34 @@
+import importlib
+from typing import Any, Callable
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    Heavy dependencies (TensorFlow, scikit-learn, Prophet, Google Cloud clients) are only needed
+    on some code paths, so importing them eagerly slows every server start.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def lazy_callable(module_name: str, name: str) -> Callable[..., Any]:
+    """A function that imports module_name.name on first call and forwards to it."""
+    module = LazyModule(module_name)
+
+    def call(*args, **kwargs):
+        return getattr(module, name)(*args, **kwargs)
+
+    call.__name__ = name
+    return call
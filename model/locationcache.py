@@ -0,0 +1,153 @@
+import glob
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import pandas as pd
+
+COLUMNS = ['id', 'timestamp', 'latitude', 'longitude']
+
+
+class LocationCache:
+    """Local Parquet copy of the BigQuery location table that only ever fetches new rows.
+
+    Each refresh queries rows newer than the newest cached timestamp and appends them as a new
+    part file; parts are compacted into one once there are more than max_parts. The cached rows
+    are also kept in memory as a typed DataFrame (UTC timestamp, float latitude/longitude).
+
+    A fix's timestamp is when it was taken, not when it was written, and a device that uploads a
+    backlog after a day offline writes rows far older than anything cached. When the table has an
+    ingestion column (BigQueryI.ingest_column) the watermark is the newest ingestion time instead,
+    looked back by `overlap` for clock skew between writers, with ids already seen dropped.
+    Without one the watermark is the newest fix timestamp minus `overlap`, and every
+    reconcile_interval seconds the cached ids are compared with the table's and any missing
+    rows are fetched by id.
+    """
+
+    def __init__(self, bq, cache_dir: str, max_parts: int = 32, overlap: pd.Timedelta = pd.Timedelta(hours=1),
+                 reconcile_interval: Optional[float] = 6 * 3600):
+        self.bq = bq
+        self.overlap = overlap
+        self.reconcile_interval = reconcile_interval
+        # None until the first refresh, so a cache read back from disk is reconciled straight away
+        self._last_reconcile: Optional[float] = None
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_parts = max_parts
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._cached_frame: Optional[pd.DataFrame] = None
+
+    @property
+    def _frame(self) -> pd.DataFrame:
+        # Read from disk on first use rather than at construction, which happens at server import
+        if self._cached_frame is None:
+            self._cached_frame = self._read_parts()
+        return self._cached_frame
+
+    @_frame.setter
+    def _frame(self, df: pd.DataFrame) -> None:
+        self._cached_frame = df
+
+    @property
+    def latest_timestamp(self) -> Optional[pd.Timestamp]:
+        return self._frame['timestamp'].iloc[-1] if len(self._frame) else None
+
+    def refresh(self) -> int:
+        """Append rows newer than the cache to disk and memory. Returns the number of new rows."""
+        with self._lock:
+            if getattr(self.bq, 'ingest_column', None):
+                new_rows = self._fetch_ingested()
+            else:
+                new_rows = self._fetch_by_timestamp()
+            if new_rows.empty:
+                return 0
+            new_rows.to_parquet(os.path.join(self.cache_dir, f'part-{time.time_ns()}.parquet'), index=False)
+            self._frame = pd.concat([self._frame, new_rows]).sort_values('timestamp', ignore_index=True, kind='stable')
+            if len(self._part_paths()) > self.max_parts:
+                self._compact()
+            logging.info("Location cache appended %d rows, now %d", len(new_rows), len(self._frame))
+            return len(new_rows)
+
+    def _fetch_ingested(self) -> pd.DataFrame:
+        ingested = self._frame['ingested_at'] if 'ingested_at' in self._frame.columns else None
+        # Rows cached before the column existed have no ingestion time
+        latest = ingested.max() if ingested is not None else pd.NaT
+        if pd.isna(latest):
+            if len(self._frame):
+                return self._missing_rows()
+            return self._normalize(self.bq.fetch_coordinates_frame())
+        since = latest - self.overlap
+        new_rows = self._normalize(self.bq.fetch_coordinates_frame(ingested_since=since))
+        recent_ids = self._frame.loc[ingested > since, 'id']
+        return new_rows[~new_rows['id'].isin(recent_ids)]
+
+    def _fetch_by_timestamp(self) -> pd.DataFrame:
+        latest = self.latest_timestamp
+        if latest is None:
+            self._last_reconcile = time.monotonic()
+            return self._normalize(self.bq.fetch_coordinates_frame())
+        since = latest - self.overlap
+        new_rows = self._normalize(self.bq.fetch_coordinates_frame(since=since))
+        recent_ids = self._frame.loc[self._frame['timestamp'] > since, 'id']
+        new_rows = new_rows[~new_rows['id'].isin(recent_ids)]
+        if self.reconcile_interval is not None and (
+                self._last_reconcile is None or time.monotonic() - self._last_reconcile >= self.reconcile_interval):
+            missing = self._missing_rows(exclude=new_rows['id'])
+            new_rows = pd.concat([new_rows, missing]).sort_values('timestamp', ignore_index=True, kind='stable')
+        return new_rows
+
+    def _missing_rows(self, exclude=()) -> pd.DataFrame:
+        """Rows in the table whose ids the cache does not have, e.g. backlogs older than the watermark."""
+        self._last_reconcile = time.monotonic()
+        missing = self.bq.fetch_ids() - set(self._frame['id']) - set(exclude)
+        if not missing:
+            return self._frame.iloc[0:0]
+        logging.info("Location cache reconciling %d rows missed by the watermark", len(missing))
+        return self._normalize(self.bq.fetch_coordinates_frame(ids=sorted(missing)))
+
+    def frame(self, since: Optional[pd.Timestamp] = None, until: Optional[pd.Timestamp] = None,
+              limit: Optional[int] = None, device_id: Optional[str] = None) -> pd.DataFrame:
+        """Cached rows with since < timestamp <= until, oldest first; limit keeps the newest rows.
+
+        device_id only selects rows when the table has a device column (see BigQueryI.device_column).
+        """
+        df = self._frame
+        if device_id is not None:
+            df = df[df['device_id'] == device_id] if 'device_id' in df.columns else df.iloc[0:0]
+        if since is not None:
+            df = df[df['timestamp'] > since]
+        if until is not None:
+            df = df[df['timestamp'] <= until]
+        if limit is not None:
+            df = df.tail(limit)
+        return df.reset_index(drop=True)
+
+    def _part_paths(self):
+        return sorted(glob.glob(os.path.join(self.cache_dir, 'part-*.parquet')))
+
+    def _read_parts(self) -> pd.DataFrame:
+        paths = self._part_paths()
+        if not paths:
+            return self._normalize(pd.DataFrame(columns=COLUMNS))
+        df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        return self._normalize(df)
+
+    def _compact(self) -> None:
+        paths = self._part_paths()
+        compacted = os.path.join(self.cache_dir, f'part-{time.time_ns()}.parquet')
+        self._frame.to_parquet(compacted, index=False)
+        for path in paths:
+            os.remove(path)
+
+    @staticmethod
+    def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+        # device_id and ingested_at are only present when the table has those columns
+        optional = [column for column in ('device_id', 'ingested_at') if column in df.columns]
+        df = df[COLUMNS + optional].astype({'latitude': 'float64', 'longitude': 'float64'})
+        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
+        if 'ingested_at' in df.columns:
+            df['ingested_at'] = pd.to_datetime(df['ingested_at'], utc=True)
+        df = df.dropna(subset=['latitude', 'longitude'])
+        return df.sort_values('timestamp', ignore_index=True, kind='stable')
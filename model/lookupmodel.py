@@ -0,0 +1,124 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from features import time_features
+from historybuffer import HistoryBuffer
+from metrics import stage_timer
+from predictor import Predictor
+
+BUCKET_MINUTES = 10
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+NUM_SLOTS = 7 * BUCKETS_PER_DAY
+
+
+def time_slots(timestamps) -> np.ndarray:
+    """Index of each timestamp's (day_of_week, 10-minute bucket) slot, 0 .. NUM_SLOTS - 1.
+
+    Slots are in UTC; naive timestamps are taken to be UTC already.
+    """
+    minute_of_day, day_of_week = time_features(timestamps)
+    return (day_of_week * BUCKETS_PER_DAY + minute_of_day // BUCKET_MINUTES).astype(np.intp)
+
+
+def nearest_filled(filled: np.ndarray, num_slots: int = NUM_SLOTS) -> np.ndarray:
+    """For every slot, the nearest slot in `filled` (sorted), wrapping around the end of the week."""
+    # Shifted copies a week either side make the nearest neighbour search circular
+    extended = np.concatenate([filled - num_slots, filled, filled + num_slots])
+    slots = np.arange(num_slots)
+    right = np.searchsorted(extended, slots).clip(1, len(extended) - 1)
+    left = right - 1
+    nearest = np.where(slots - extended[left] <= extended[right] - slots, extended[left], extended[right])
+    return nearest % num_slots
+
+
+class LookupModel(Predictor):
+    """Predicts the position most often seen in the same weekly 10-minute slot.
+
+    Training groups fixes by (day_of_week, 10-minute bucket) and by a grid cell of
+    cell_degrees, and keeps the mean position of the busiest cell of each slot. Slots without
+    any fixes copy the nearest slot in time that has some. Prediction is then a single array
+    lookup per request; the current position is not used.
+    """
+
+    backend = "lookup"
+
+    def __init__(self, cell_degrees: float = 0.001, history: Optional[HistoryBuffer] = None):
+        super().__init__(history)
+        self.cell_degrees = cell_degrees
+        # (NUM_SLOTS, 2) latitude/longitude per slot, and how many fixes backed each slot's position
+        self.positions: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+
+    def options(self) -> Dict[str, Any]:
+        return {'cell_degrees': self.cell_degrees}
+
+    def process_and_train(self, raw_df: pd.DataFrame) -> None:
+        """Build the slot table from raw_df (timestamp, latitude, longitude)."""
+        df = pd.DataFrame({
+            'slot': time_slots(raw_df['timestamp']),
+            'cell_lat': np.floor(raw_df['latitude'].to_numpy() / self.cell_degrees).astype(np.int64),
+            'cell_lon': np.floor(raw_df['longitude'].to_numpy() / self.cell_degrees).astype(np.int64),
+            'latitude': raw_df['latitude'].to_numpy(dtype=np.float64),
+            'longitude': raw_df['longitude'].to_numpy(dtype=np.float64),
+        }).dropna(subset=['latitude', 'longitude'])
+        if df.empty:
+            raise ValueError("No fixes to train the lookup table on")
+
+        cells = df.groupby(['slot', 'cell_lat', 'cell_lon'], sort=False).agg(
+            count=('latitude', 'size'), latitude=('latitude', 'mean'), longitude=('longitude', 'mean')
+        ).reset_index()
+        # Busiest cell per slot; ties go to the cell seen first
+        busiest = cells.sort_values('count', ascending=False, kind='stable').drop_duplicates('slot')
+
+        positions = np.full((NUM_SLOTS, 2), np.nan)
+        counts = np.zeros(NUM_SLOTS, dtype=np.int64)
+        slots = busiest['slot'].to_numpy()
+        positions[slots] = busiest[['latitude', 'longitude']].to_numpy()
+        counts[slots] = busiest['count'].to_numpy()
+
+        filled = np.flatnonzero(counts)
+        self.positions = positions[nearest_filled(filled)]
+        self.counts = counts
+        self._mark_full_train(raw_df)
+        logging.info("Lookup table built from %d fixes, %d of %d slots observed", len(df), len(filled), NUM_SLOTS)
+
+    def lookup(self, slots: np.ndarray) -> np.ndarray:
+        """(lat, lon) rows for an array of slot indexes, see time_slots."""
+        return self.positions[slots]
+
+    def _check_trained(self) -> None:
+        if self.positions is None:
+            raise ValueError("Lookup table is not built. Train the model first or load it.")
+
+    def _forward(self, prediction_request: List[Dict[str, Any]], timestamps: List[pd.Timestamp]) -> np.ndarray:
+        with stage_timer("forward"):
+            return self.lookup(time_slots(timestamps))
+
+    def save_model(self, base_path: str) -> str:
+        logging.info("Saving lookup model version %d to %s", self.version, base_path)
+        base_path = os.path.expanduser(base_path)
+        os.makedirs(base_path, exist_ok=True)
+        np.save(os.path.join(base_path, 'positions.npy'), self.positions)
+        np.save(os.path.join(base_path, 'counts.npy'), self.counts)
+        self._save_meta(base_path, cell_degrees=self.cell_degrees)
+        return base_path
+
+    @classmethod
+    def load_model(cls, base_path: str, history: Optional[HistoryBuffer] = None, mmap: bool = False,
+                   build: bool = True) -> 'LookupModel':
+        base_path = os.path.expanduser(base_path)
+        meta = cls._read_meta(base_path)
+        lookup_model = cls(cell_degrees=meta['cell_degrees'], history=history)
+        lookup_model._apply_meta(meta)
+        mmap_mode = 'r' if mmap else None
+        lookup_model.positions = np.load(os.path.join(base_path, 'positions.npy'), mmap_mode=mmap_mode)
+        lookup_model.counts = np.load(os.path.join(base_path, 'counts.npy'), mmap_mode=mmap_mode)
+        logging.info("Loaded lookup model version %d from %s", lookup_model.version, base_path)
+        return lookup_model
+
+    def nbytes(self) -> int:
+        return self.positions.nbytes + self.counts.nbytes if self.positions is not None else 0
@@ -0,0 +1,131 @@
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cached prediction (tens of microseconds) up to a long training epoch
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Histogram:
+    """Prometheus-style latency histogram with one series per value of a single label.
+
+    observe is a bisect and three additions under a lock, cheap enough to leave on around
+    every stage of a request.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str = "stage", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        # label value -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def time(self, label_value: str) -> '_Timer':
+        """Context manager observing the time spent inside it."""
+        return _Timer(self, label_value)
+
+    def drain(self) -> Dict[str, list]:
+        """Return the raw series and reset them, e.g. to send a worker process's observations home."""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[str, list]) -> None:
+        """Add series returned by another process's drain."""
+        with self._lock:
+            for label_value, (counts, total, count) in series.items():
+                mine = self._series.get(label_value)
+                if mine is None:
+                    mine = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                mine[1] += total
+                mine[2] += count
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label_value: (list(counts), total, count)
+                      for label_value, (counts, total, count) in self._series.items()}
+        for label_value, (counts, total, count) in sorted(series.items()):
+            labels = f'{self.label}="{escape(label_value)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total!r}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class _Timer:
+    # A plain class rather than @contextmanager, which costs a few microseconds more per use
+    __slots__ = ("histogram", "label_value", "start")
+
+    def __init__(self, histogram: Histogram, label_value: str):
+        self.histogram = histogram
+        self.label_value = label_value
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(self.label_value, time.perf_counter() - self.start)
+
+
+# Per-stage latency of the model service. Stages: predict (the whole request), request_parse,
+# timestamp_parse, features, scaling, forward, bigquery_query, bigquery_insert, training and training_epoch
+STAGE_SECONDS = Histogram("bishop_stage_duration_seconds", "Time spent in each stage of serving and training.")
+
+
+def stage_timer(stage: str) -> _Timer:
+    """Context manager adding the time spent inside it to STAGE_SECONDS under stage."""
+    return STAGE_SECONDS.time(stage)
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_metric(name: str, help_text: str, metric_type: str,
+                  samples: Sequence[Tuple[Optional[Dict[str, str]], float]]) -> List[str]:
+    """Text exposition lines for a gauge or counter given (labels, value) samples."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = "{" + ",".join(f'{key}="{escape(val)}"' for key, val in labels.items()) + "}" if labels else ""
+        lines.append(f"{name}{label_text} {float(value)!r}")
+    return lines
+
+
+def peak_resident_memory_bytes() -> int:
+    """Highest resident set size this process has reached."""
+    import resource
+    import sys
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def resident_memory_bytes() -> int:
+    """Current resident set size of this process; the peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_resident_memory_bytes()
@@ -0,0 +1,256 @@
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from historybuffer import HistoryBuffer
+from modelstore import ModelArtifactStore
+from predictor import Predictor, backend_class, load_predictor
+from metrics import STAGE_SECONDS
+from trainer import _lower_priority, train_snapshot_timed
+
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def valid_tenant_id(tenant_id: str) -> bool:
+    """Tenant ids end up in file and blob names, so only allow a safe character set."""
+    return isinstance(tenant_id, str) and bool(TENANT_ID_PATTERN.match(tenant_id))
+
+
+class ModelRegistry:
+    """Per-tenant model snapshots, loaded lazily and evicted least-recently-used.
+
+    At most max_models snapshots are kept in memory, and fewer if their estimated size would
+    exceed memory_budget_bytes. Each tenant's bundles live in their own artifact store, created
+    by store_factory(tenant_id). Tenants without a published snapshot get None, and callers fall
+    back to the shared model. Loaded models share `history`, which is keyed by device already.
+    """
+
+    def __init__(self, store_factory: Callable[[str], ModelArtifactStore], max_models: int = 8,
+                 memory_budget_bytes: Optional[int] = None, per_model_overhead_bytes: int = 16 * 1024 * 1024,
+                 history: Optional[HistoryBuffer] = None,
+                 on_swap: Optional[Callable[[str, Predictor], None]] = None):
+        """on_swap(tenant_id, model) is called whenever a tenant starts being served by a different model."""
+        self.store_factory = store_factory
+        self.history = history
+        self.on_swap = on_swap
+        self.max_models = max_models
+        self.memory_budget_bytes = memory_budget_bytes
+        self.per_model_overhead_bytes = per_model_overhead_bytes
+        self._models: "OrderedDict[str, Predictor]" = OrderedDict()
+        self._missing: set = set()
+        self._stores: Dict[str, ModelArtifactStore] = {}
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    def store(self, tenant_id: str) -> ModelArtifactStore:
+        with self._lock:
+            if tenant_id not in self._stores:
+                self._stores[tenant_id] = self.store_factory(tenant_id)
+            return self._stores[tenant_id]
+
+    def get(self, tenant_id: str) -> Optional[Predictor]:
+        """The tenant's model, loading its newest published snapshot on first use."""
+        if not valid_tenant_id(tenant_id):
+            return None
+        with self._lock:
+            model = self._models.get(tenant_id)
+            if model is not None:
+                self._models.move_to_end(tenant_id)
+                return model
+            if tenant_id in self._missing:
+                return None
+
+        snapshot_path = self.store(tenant_id).fetch_latest()
+        if snapshot_path is None:
+            with self._lock:
+                self._missing.add(tenant_id)
+            return None
+        model = load_predictor(snapshot_path, history=self.history, mmap=True, build=False)
+        # In the caller's thread, so the coalescer's batches never wait for a model to warm up
+        model.warm_up()
+        self.loads += 1
+        self.put(tenant_id, model)
+        return model
+
+    def peek(self, tenant_id: str) -> Optional[Predictor]:
+        """The tenant's model if it is loaded already. Never touches the bucket."""
+        with self._lock:
+            model = self._models.get(tenant_id)
+            if model is not None:
+                self._models.move_to_end(tenant_id)
+            return model
+
+    def refresh(self) -> int:
+        """Reload loaded tenants whose published snapshot is newer and forget which tenants had none.
+
+        For serving processes that do not train. Returns the number of models reloaded.
+        """
+        with self._lock:
+            self._missing.clear()
+            loaded = list(self._models.items())
+        reloaded = 0
+        for tenant_id, current in loaded:
+            snapshot_path = self.store(tenant_id).fetch_latest()
+            if snapshot_path is None:
+                continue
+            model = load_predictor(snapshot_path, history=self.history, mmap=True, build=False)
+            if model.version > current.version:
+                model.warm_up()
+                reloaded += self.replace(tenant_id, model)
+        return reloaded
+
+    def replace(self, tenant_id: str, model: Predictor) -> bool:
+        """Serve model for the tenant if it is loaded, without evicting anyone. Returns True if replaced.
+
+        Tenants that are not loaded pick up the newest published snapshot on their next get().
+        """
+        with self._lock:
+            self._missing.discard(tenant_id)
+            if tenant_id not in self._models:
+                return False
+            self._models[tenant_id] = model
+        if self.on_swap is not None:
+            self.on_swap(tenant_id, model)
+        return True
+
+    def put(self, tenant_id: str, model: Predictor) -> None:
+        """Make model the tenant's serving snapshot, evicting others if over the limits."""
+        with self._lock:
+            self._missing.discard(tenant_id)
+            self._models[tenant_id] = model
+            self._models.move_to_end(tenant_id)
+            self._evict()
+        if self.on_swap is not None:
+            self.on_swap(tenant_id, model)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(self._estimate(model) for model in self._models.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": len(self._models),
+                "memory_bytes": self.memory_bytes(),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def _estimate(self, model: Predictor) -> int:
+        return model.nbytes() + self.per_model_overhead_bytes
+
+    def _evict(self) -> None:
+        # Always keep the most recently used model, even if it alone exceeds the budget
+        while len(self._models) > 1 and (
+            len(self._models) > self.max_models
+            or (self.memory_budget_bytes is not None and self.memory_bytes() > self.memory_budget_bytes)
+        ):
+            tenant_id, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logging.info("Evicted model for tenant %s", tenant_id)
+
+
+class TenantTrainer:
+    """Trains per-tenant snapshots of one backend across a pool of worker processes and publishes them.
+
+    Like the shared model, a tenant is fine-tuned on the rows after its published snapshot's
+    trained_until watermark, and only trained from scratch when it has no snapshot yet, its last
+    full training is older than full_retrain_interval, the backend cannot fine-tune, or the new
+    rows drift out of the fitted range. Tenants with no new rows are skipped.
+    """
+
+    def __init__(self, registry: ModelRegistry, snapshot_dir: str, max_workers: int = 2, backend: str = "lstm",
+                 options: Optional[Dict[str, Any]] = None,
+                 full_retrain_interval: pd.Timedelta = pd.Timedelta(hours=24)):
+        self.registry = registry
+        self.backend = backend
+        self.options = options if options is not None else backend_class(backend)().options()
+        self.snapshot_dir = os.path.expanduser(snapshot_dir)
+        self.max_workers = max_workers
+        self.full_retrain_interval = full_retrain_interval
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _training_job(self, tenant_id: str, df: pd.DataFrame) -> Optional[Tuple[pd.DataFrame, Optional[str]]]:
+        """The rows to train the tenant on and the snapshot to fine-tune, if any. None when it is up to date."""
+        snapshot_path = self.registry.store(tenant_id).fetch_latest()
+        if snapshot_path is None:
+            return df, None
+        # Unbuilt, only for its metadata and scalers
+        published = load_predictor(snapshot_path, mmap=True, build=False)
+        timestamps = pd.to_datetime(df['timestamp'], utc=True)
+        trained_until = published.trained_until
+        if trained_until is not None and trained_until.tzinfo is None:
+            trained_until = trained_until.tz_localize('UTC')
+        if trained_until is not None and timestamps.max() <= trained_until:
+            return None
+        new_rows = df[timestamps > trained_until] if trained_until is not None else df
+        if (trained_until is None or not published.supports_fine_tune
+                or published.full_retrain_due(self.full_retrain_interval) or published.detect_drift(new_rows)):
+            return df, None
+        # Include the rows just before the watermark so the first new windows have full context
+        if published.context_span is not None:
+            context = df[(timestamps > trained_until - published.context_span) & (timestamps <= trained_until)]
+        else:
+            context = df[timestamps <= trained_until].tail(published.sequence_length)
+        return pd.concat([context, new_rows], ignore_index=True), snapshot_path
+
+    def train_all(self, frames: Dict[str, pd.DataFrame]) -> Dict[str, Predictor]:
+        """Train the tenants in frames ({tenant_id: (timestamp, latitude, longitude) frame}). Blocks until done.
+
+        Returns the new models of the tenants that were trained or fine-tuned.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_lower_priority
+            )
+
+        futures = {}
+        for tenant_id, df in frames.items():
+            if not valid_tenant_id(tenant_id):
+                logging.warning("Skipping training for invalid tenant id %r", tenant_id)
+                continue
+            job = self._training_job(tenant_id, df)
+            if job is None:
+                logging.info("Tenant %s has no rows after its published snapshot, skipping", tenant_id)
+                continue
+            rows, base_path = job
+            # From the manifest, so training does not load every tenant's snapshot or evict served ones
+            published = self.registry.store(tenant_id).latest_version()
+            version = published + 1 if published is not None else 1
+            output_path = os.path.join(self.snapshot_dir, tenant_id, f'v{version}')
+            future = self._executor.submit(train_snapshot_timed, rows, output_path, version, self.backend,
+                                           self.options, base_path)
+            futures[future] = (tenant_id, version)
+
+        trained = {}
+        for future in as_completed(futures):
+            tenant_id, version = futures[future]
+            try:
+                snapshot_path, timings = future.result()
+            except Exception as e:
+                logging.error("Training failed for tenant %s: %s", tenant_id, e)
+                continue
+            STAGE_SECONDS.merge(timings)
+            model = load_predictor(snapshot_path, history=self.registry.history, mmap=True, build=False)
+            self.registry.store(tenant_id).publish(snapshot_path, version)
+            # Tenants that are not being served are left to load the published snapshot on demand
+            if self.registry.peek(tenant_id) is not None:
+                model.warm_up()
+                self.registry.replace(tenant_id, model)
+            # The published bundle is the durable copy; older local snapshots are not needed
+            for name in os.listdir(os.path.dirname(snapshot_path)):
+                if name != f'v{version}':
+                    shutil.rmtree(os.path.join(os.path.dirname(snapshot_path), name), ignore_errors=True)
+            trained[tenant_id] = model
+        return trained
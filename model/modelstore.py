@@ -0,0 +1,139 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+from typing import Optional
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelArtifactStore:
+    """Versioned model bundles in a bucket, with a checksum-verified local cache.
+
+    A bundle is a snapshot directory written by a predictor's save_model (meta.json with the
+    backend and training watermark, plus the backend's own files) packed as
+    <prefix>-v<version>.tar.gz. The <prefix>-latest.json manifest names the newest bundle and
+    its sha256. `remote` is anything with upload_file/download_file/list_files/delete_file, e.g.
+    CloudStorageI or LocalStorageI.
+
+    Only the newest keep_versions bundles are kept, both in the bucket and as local archives and
+    extracted directories, the way BackgroundTrainer keeps its snapshots.
+    """
+
+    def __init__(self, remote, cache_dir: str, prefix: str = "bishop", keep_versions: int = 3):
+        self.remote = remote
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.prefix = prefix
+        self.keep_versions = keep_versions
+        # Matches this prefix's archives and extracted directories, not those of a longer prefix
+        self._version_pattern = re.compile(rf"^{re.escape(prefix)}-v(\d+)(\.tar\.gz)?$")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def manifest_name(self) -> str:
+        return f"{self.prefix}-latest.json"
+
+    def archive_name(self, version: int) -> str:
+        return f"{self.prefix}-v{version}.tar.gz"
+
+    def publish(self, snapshot_path: str, version: int) -> str:
+        """Pack a snapshot directory, upload it, then point the manifest at it. Returns the checksum."""
+        archive_path = os.path.join(self.cache_dir, self.archive_name(version))
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            archive.add(snapshot_path, arcname='.')
+        checksum = file_sha256(archive_path)
+        self.remote.upload_file(archive_path, self.archive_name(version))
+
+        # Upload the manifest last so readers never see a version whose archive is missing
+        manifest = {"version": version, "archive": self.archive_name(version), "sha256": checksum}
+        manifest_path = os.path.join(self.cache_dir, self.manifest_name)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        self.remote.upload_file(manifest_path, self.manifest_name)
+        logging.info("Published model version %d (%s)", version, checksum[:12])
+        self._prune_remote(version)
+        self._prune_local(version)
+        return checksum
+
+    def fetch_latest(self) -> Optional[str]:
+        """Return a local snapshot directory for the newest published bundle, or None if there is none.
+
+        Holds a lock on the cache directory, so processes sharing it do not extract over each other.
+        """
+        with open(os.path.join(self.cache_dir, f"{self.prefix}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return self._fetch_latest()
+
+    def _fetch_latest(self) -> Optional[str]:
+        manifest = self._read_manifest()
+        if manifest is None:
+            logging.info("No published model found for prefix %s", self.prefix)
+            return None
+
+        snapshot_path = os.path.join(self.cache_dir, f"{self.prefix}-v{manifest['version']}")
+        archive_path = os.path.join(self.cache_dir, manifest['archive'])
+        marker_path = os.path.join(snapshot_path, '.sha256')
+        if os.path.exists(marker_path):
+            with open(marker_path) as f:
+                if f.read().strip() == manifest['sha256']:
+                    logging.info("Using cached model version %d", manifest['version'])
+                    return snapshot_path
+
+        if not os.path.exists(archive_path) or file_sha256(archive_path) != manifest['sha256']:
+            self.remote.download_file(manifest['archive'], archive_path)
+            if not os.path.exists(archive_path) or file_sha256(archive_path) != manifest['sha256']:
+                logging.error("Checksum mismatch for %s, ignoring it", manifest['archive'])
+                return None
+
+        shutil.rmtree(snapshot_path, ignore_errors=True)
+        with tarfile.open(archive_path, 'r:gz') as archive:
+            archive.extractall(snapshot_path, filter='data')
+        with open(marker_path, 'w') as f:
+            f.write(manifest['sha256'])
+        logging.info("Downloaded model version %d", manifest['version'])
+        self._prune_local(manifest['version'])
+        return snapshot_path
+
+    def _stale_versions(self, names, current: int):
+        """Versions among names older than the newest keep_versions, never including current."""
+        versions = sorted({int(match.group(1)) for match in map(self._version_pattern.match, names) if match})
+        return [version for version in versions[:-self.keep_versions] if version != current]
+
+    def _prune_remote(self, current: int) -> None:
+        names = self.remote.list_files(f"{self.prefix}-v")
+        for version in self._stale_versions(names, current):
+            self.remote.delete_file(self.archive_name(version))
+
+    def _prune_local(self, current: int) -> None:
+        # Extracted directories of older versions may still be mapped by a serving model; on POSIX
+        # removing them only unlinks the names, and the newest keep_versions are kept regardless
+        for version in self._stale_versions(os.listdir(self.cache_dir), current):
+            archive_path = os.path.join(self.cache_dir, self.archive_name(version))
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            shutil.rmtree(os.path.join(self.cache_dir, f"{self.prefix}-v{version}"), ignore_errors=True)
+
+    def latest_version(self) -> Optional[int]:
+        """Version named by the manifest, without downloading the bundle; None if nothing is published."""
+        manifest = self._read_manifest()
+        return manifest['version'] if manifest is not None else None
+
+    def _read_manifest(self) -> Optional[dict]:
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest_path = os.path.join(tmp, self.manifest_name)
+            self.remote.download_file(self.manifest_name, manifest_path)
+            if not os.path.exists(manifest_path):
+                return None
+            with open(manifest_path) as f:
+                return json.load(f)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import pandas as pd
+
+from features import time_features
+from historybuffer import DEFAULT_DEVICE
+
+
+class PredictionCache:
+    """Bounded LRU + TTL cache of predicted coordinates.
+
+    Entries are keyed on the device, its position rounded to `precision` decimal places, the
+    10-minute minute_of_day bucket and day_of_week of the requested timestamp in UTC (the same
+    features.time_features the model sees), and the model version, so a retrain never serves
+    answers from the previous model.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl_seconds: float = 600.0, precision: int = 3):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self.precision = precision
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[float, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, req: Dict[str, Any], model_version: int, timestamp: Optional[pd.Timestamp] = None) -> Hashable:
+        """timestamp is req's timestamp already parsed, if the caller has it."""
+        minute_of_day, day_of_week = time_features([timestamp if timestamp is not None else pd.Timestamp(req["timestamp"])])
+        return (
+            req.get("device_id", DEFAULT_DEVICE),
+            round(float(req["current_lat"]), self.precision),
+            round(float(req["current_long"]), self.precision),
+            int(minute_of_day[0]) // 10,
+            int(day_of_week[0]),
+            model_version,
+        )
+
+    def get(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, coordinates: Tuple[float, float]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, coordinates)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
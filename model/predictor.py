@@ -0,0 +1,196 @@
+import importlib
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Type
+
+import numpy as np
+import pandas as pd
+
+from historybuffer import HistoryBuffer, DEFAULT_DEVICE
+from metrics import stage_timer
+from predictioncache import PredictionCache
+
+# Backend name -> (module, class); imported on first use so unused backends cost nothing at startup
+BACKENDS = {
+    "lstm": ("bishopmodel", "BishopModel"),
+    "prophet": ("alternatemodel", "AlternateModel"),
+    "lookup": ("lookupmodel", "LookupModel"),
+}
+
+
+def backend_class(name: str) -> Type['Predictor']:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown predictor backend {name!r}, expected one of {sorted(BACKENDS)}")
+    module_name, class_name = BACKENDS[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def load_predictor(base_path: str, **kwargs) -> 'Predictor':
+    """Load a snapshot written by any backend's save_model. kwargs are passed on to its load_model."""
+    with open(os.path.join(os.path.expanduser(base_path), 'meta.json')) as f:
+        # Snapshots from before backends were pluggable are all LSTM snapshots
+        backend = json.load(f).get('backend', 'lstm')
+    return backend_class(backend).load_model(base_path, **kwargs)
+
+
+class Predictor(ABC):
+    """Interface shared by the location prediction backends.
+
+    Training takes a frame of fixes (timestamp, latitude, longitude, and device_id when the table
+    has a device column; backends that model one trajectory ignore it). Prediction takes the
+    request dicts of /model/coordinates/predict (current_lat, current_long, timestamp and an
+    optional device_id) and returns one {timestamp, predicted_lat, predicted_long} per request.
+    A snapshot is a directory holding meta.json plus whatever files the backend needs.
+    """
+
+    backend: str = ""
+    # Whether fine_tune can update a snapshot in place, and how many earlier rows it needs as context
+    supports_fine_tune = False
+    sequence_length = 0
+    # When set, fine-tuning context is the rows within this span before the watermark instead
+    context_span: Optional[pd.Timedelta] = None
+
+    def __init__(self, history: Optional[HistoryBuffer] = None):
+        self.history = history
+        self.version = 0
+        # High-water mark of the data the snapshot has seen, and when it was last trained from scratch
+        self.trained_until: Optional[pd.Timestamp] = None
+        self.last_full_train: Optional[pd.Timestamp] = None
+
+    @abstractmethod
+    def process_and_train(self, raw_df: pd.DataFrame) -> Any:
+        """Train from scratch on raw_df."""
+
+    @abstractmethod
+    def _check_trained(self) -> None:
+        """Raise ValueError if the predictor cannot answer requests yet."""
+
+    @abstractmethod
+    def _forward(self, prediction_request: List[Dict[str, Any]], timestamps: List[pd.Timestamp]) -> np.ndarray:
+        """Return one (lat, lon) row per request."""
+
+    @abstractmethod
+    def save_model(self, base_path: str) -> str:
+        """Save the snapshot into base_path. Returns base_path."""
+
+    @classmethod
+    @abstractmethod
+    def load_model(cls, base_path: str, history: Optional[HistoryBuffer] = None, mmap: bool = False,
+                   build: bool = True) -> 'Predictor':
+        """Load a snapshot written by save_model. Backends without heavy state may ignore mmap and build."""
+
+    def options(self) -> Dict[str, Any]:
+        """Constructor arguments that a retrained snapshot should keep."""
+        return {}
+
+    def warm_up(self) -> None:
+        """Do the one-off work of a first predict now, before the snapshot is swapped in to serve."""
+
+    def cached(self, prediction_request: List[Dict[str, Any]], cache: PredictionCache) -> List[Optional[Dict[str, Any]]]:
+        """Results for the requests this model version answered recently, None for the others."""
+        timestamps = self._parse_timestamps(prediction_request)
+        results = []
+        for req, timestamp in zip(prediction_request, timestamps):
+            coords = cache.get(cache.key(req, self.version, timestamp))
+            results.append(None if coords is None else self._result(timestamp, coords))
+        return results
+
+    def predict(self, prediction_request: List[Dict[str, Any]], cache: Optional[PredictionCache] = None,
+                lookup: bool = True) -> List[Dict[str, Any]]:
+        """Predict coordinates for all prediction requests in one batch.
+
+        With a cache, requests whose key was answered recently by this model version skip the forward
+        pass. lookup=False only stores the results, for callers that already looked them up with cached().
+        """
+        logging.info("Predicting coordinates for %d requests", len(prediction_request))
+        self._check_trained()
+        if not prediction_request:
+            return []
+
+        timestamps = self._parse_timestamps(prediction_request)
+        predicted_coordinates = np.empty((len(prediction_request), 2))
+        missing = list(range(len(prediction_request)))
+        if cache is not None:
+            keys = [cache.key(req, self.version, timestamp) for req, timestamp in zip(prediction_request, timestamps)]
+        if cache is not None and lookup:
+            missing = []
+            for i, key in enumerate(keys):
+                cached = cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    predicted_coordinates[i] = cached
+
+        if missing:
+            predicted_coordinates[missing] = self._forward(
+                [prediction_request[i] for i in missing], [timestamps[i] for i in missing]
+            )
+            if cache is not None:
+                for i in missing:
+                    cache.put(keys[i], tuple(predicted_coordinates[i]))
+
+        results = [self._result(timestamp, coords) for timestamp, coords in zip(timestamps, predicted_coordinates)]
+
+        logging.info("Prediction completed for all requests")
+        return results
+
+    @staticmethod
+    def _parse_timestamps(prediction_request: List[Dict[str, Any]]) -> List[pd.Timestamp]:
+        with stage_timer("timestamp_parse"):
+            # pd.Timestamp parses a single value far faster than pd.to_datetime
+            return [pd.Timestamp(req["timestamp"]) for req in prediction_request]
+
+    @staticmethod
+    def _result(timestamp: pd.Timestamp, coords) -> Dict[str, Any]:
+        return {
+            "timestamp": timestamp.isoformat(),
+            "predicted_lat": float(coords[0]),  # Convert to native float
+            "predicted_long": float(coords[1])  # Convert to native float
+        }
+
+    def fine_tune(self, raw_df: pd.DataFrame) -> Any:
+        raise NotImplementedError(f"The {self.backend} backend can only be retrained from scratch")
+
+    def record_observations(self, df: pd.DataFrame, device_id: str = DEFAULT_DEVICE) -> int:
+        """Push observed fixes into the device's rolling history, for backends that use one."""
+        return 0
+
+    def detect_drift(self, raw_df: pd.DataFrame, threshold: float = 0.1) -> bool:
+        """True when raw_df no longer matches what the snapshot was trained on."""
+        return False
+
+    def full_retrain_due(self, max_age: pd.Timedelta) -> bool:
+        """True when the model has never been trained from scratch or that was longer than max_age ago."""
+        return self.last_full_train is None or pd.Timestamp.now(tz='UTC') - self.last_full_train > max_age
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the snapshot's parameters."""
+        return 0
+
+    def _mark_full_train(self, df: pd.DataFrame) -> None:
+        self.trained_until = pd.to_datetime(df['timestamp']).max()
+        self.last_full_train = pd.Timestamp.now(tz='UTC')
+
+    def _save_meta(self, base_path: str, **extra: Any) -> None:
+        with open(os.path.join(base_path, 'meta.json'), 'w') as f:
+            json.dump({
+                'backend': self.backend,
+                'version': self.version,
+                'trained_until': self.trained_until.isoformat() if self.trained_until is not None else None,
+                'last_full_train': self.last_full_train.isoformat() if self.last_full_train is not None else None,
+                **extra
+            }, f)
+
+    @staticmethod
+    def _read_meta(base_path: str) -> Dict[str, Any]:
+        with open(os.path.join(base_path, 'meta.json')) as f:
+            return json.load(f)
+
+    def _apply_meta(self, meta: Dict[str, Any]) -> None:
+        self.version = meta['version']
+        if meta.get('trained_until'):
+            self.trained_until = pd.Timestamp(meta['trained_until'])
+        if meta.get('last_full_train'):
+            self.last_full_train = pd.Timestamp(meta['last_full_train'])
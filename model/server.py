@@ -1,92 +1,547 @@
 print("Whirring the engines ...")
-from flask import Flask, request, jsonify
-from influxdb_client.client.write_api import SYNCHRONOUS
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
-from google.cloud import bigquery
 import os
+import atexit
+import threading
+import time
 from datetime import datetime
 import uuid
 from flask_apscheduler import APScheduler
 from bigquery import BigQueryI
-from bishopmodel import BishopModel
-from alternatemodel import AlternateModel
+from predictor import backend_class, load_predictor
+from historybuffer import DEFAULT_DEVICE
+from trainer import BackgroundTrainer
+from coalescer import PredictCoalescer
+from predictioncache import PredictionCache
 import pandas as pd
-from cloudstorage import CloudStorageI
+from cloudstorage import CloudStorageI, LocalStorageI
+from modelstore import ModelArtifactStore
+from modelregistry import ModelRegistry, TenantTrainer, valid_tenant_id
+from locationcache import LocationCache
+from metrics import STAGE_SECONDS, render_metric, resident_memory_bytes, stage_timer
+from latestposition import LatestPositionStore
 from flask_cors import CORS  # Import CORS
-from dotenv import load_dotenv
 
 print("Imports completed ...")
-bishop = BishopModel()
-# cloudstorage = CloudStorageI("bdarch-bishop-models")
+load_dotenv()
+
+TRAINING_COLUMNS = ["timestamp", "latitude", "longitude"]
+
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/tmp/bishop-model-cache")
+# lstm (BishopModel), prophet (AlternateModel) or lookup (LookupModel)
+PREDICTOR_BACKEND = os.getenv("PREDICTOR_BACKEND", "lstm")
+# Prophet fits are reused from here when a retrain sees the same rows, e.g. after a restart
+PREDICTOR_OPTIONS = {"cache_dir": os.getenv("PROPHET_CACHE_DIR", "/tmp/bishop-prophet-cache")} \
+    if PREDICTOR_BACKEND == "prophet" else {}
+# Each backend publishes under its own prefix, so switching backends never loads the other's bundles
+ARTIFACT_PREFIX = "bishop" if PREDICTOR_BACKEND == "lstm" else f"bishop-{PREDICTOR_BACKEND}"
+
+
+def load_remote():
+    """Model bundles go to MODEL_BUCKET when set, otherwise to a local directory standing in for the bucket."""
+    bucket = os.getenv("MODEL_BUCKET")
+    return CloudStorageI(bucket) if bucket else LocalStorageI(os.getenv("MODEL_ARTIFACT_DIR", "~/MODEL"))
+
+
+# Published bundles kept in the bucket and the local cache, per prefix
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "3"))
+
+
+def load_artifact_store():
+    return ModelArtifactStore(load_remote(), cache_dir=MODEL_CACHE_DIR, prefix=ARTIFACT_PREFIX,
+                              keep_versions=MODEL_KEEP_VERSIONS)
+
+
+def load_tenant_store(tenant_id):
+    return ModelArtifactStore(load_remote(), cache_dir=os.path.join(MODEL_CACHE_DIR, "tenants", tenant_id),
+                              prefix=f"{ARTIFACT_PREFIX}-tenant-{tenant_id}", keep_versions=MODEL_KEEP_VERSIONS)
+
+
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv("PREDICT_CACHE_SIZE", "4096")),
+    ttl_seconds=float(os.getenv("PREDICT_CACHE_TTL_SECONDS", "600")),
+    precision=int(os.getenv("PREDICT_CACHE_PRECISION", "3"))
+)
+# Serves an untrained placeholder until load_published_model swaps in the newest bundle
+trainer = BackgroundTrainer(
+    backend_class(PREDICTOR_BACKEND)(**PREDICTOR_OPTIONS),
+    snapshot_dir=os.getenv("MODEL_SNAPSHOT_DIR", "/tmp/bishop-snapshots"),
+    on_swap=lambda model: prediction_cache.invalidate()
+)
+model_ready = threading.Event()
+
+# Per-device models, trained for devices with enough rows of their own; everyone else gets the shared model
+TENANT_MODELS = os.getenv("TENANT_MODELS", "false").lower() == "true"
+memory_budget_mb = os.getenv("MODEL_MEMORY_BUDGET_MB")
+registry = ModelRegistry(
+    load_tenant_store,
+    max_models=int(os.getenv("TENANT_MAX_MODELS", "8")),
+    memory_budget_bytes=int(float(memory_budget_mb) * 1024 * 1024) if memory_budget_mb else None,
+    history=trainer.model.history,
+    # Tenant and shared model versions overlap, so cached answers cannot tell them apart
+    on_swap=lambda tenant_id, model: prediction_cache.invalidate()
+)
+FULL_RETRAIN_INTERVAL = pd.Timedelta(hours=float(os.getenv("FULL_RETRAIN_HOURS", "24")))
+tenant_trainer = TenantTrainer(
+    registry,
+    snapshot_dir=os.path.join(os.getenv("MODEL_SNAPSHOT_DIR", "/tmp/bishop-snapshots"), "tenants"),
+    max_workers=int(os.getenv("TENANT_TRAINING_WORKERS", "2")),
+    backend=PREDICTOR_BACKEND,
+    full_retrain_interval=FULL_RETRAIN_INTERVAL
+)
+TENANT_MIN_ROWS = int(os.getenv("TENANT_MIN_ROWS", "2000"))
+
+
+def load_published_model():
+    """Start from the newest published bundle so a restart does not wait for a full training run."""
+    if model_ready.is_set():
+        return
+    try:
+        trainer.artifact_store = load_artifact_store()
+        snapshot_path = trainer.artifact_store.fetch_latest()
+        if snapshot_path:
+            # Served with NumPy from the memory-mapped weights, which all workers share
+            model = load_predictor(snapshot_path, history=trainer.model.history, mmap=True, build=False)
+            model.warm_up()
+            trainer.swap(model, snapshot_path)
+    except Exception as e:
+        print(f"Failed to load the published model: {str(e)}")
+    finally:
+        model_ready.set()
+
+
+def serving_model(device_id, load=True):
+    """The model answering device_id: its own when it has a published one, else the shared model.
+
+    load=False only uses tenant models already in memory, so it never waits on the bucket.
+    """
+    if not TENANT_MODELS:
+        return trainer.model
+    try:
+        return (registry.get(device_id) if load else registry.peek(device_id)) or trainer.model
+    except Exception as e:
+        print(f"Failed to load the model for {device_id}, using the shared model: {str(e)}")
+        return trainer.model
+
+
+def by_device(prediction_request):
+    groups = {}
+    for i, req in enumerate(prediction_request):
+        groups.setdefault(req.get("device_id", DEFAULT_DEVICE), []).append(i)
+    return groups
+
+
+def cached_predictions(prediction_request):
+    """Answers already in the prediction cache, looked up before the requests wait for a batch.
+
+    Runs in the caller's thread, so tenant models are loaded here rather than in the batching thread.
+    """
+    results = [None] * len(prediction_request)
+    for device_id, indexes in by_device(prediction_request).items():
+        cached = serving_model(device_id).cached([prediction_request[i] for i in indexes], prediction_cache)
+        for i, result in zip(indexes, cached):
+            results[i] = result
+    return results
+
+
+def predict_routed(prediction_request):
+    """Predict each request with its device's model, falling back to the shared model."""
+    # cached_predictions has already looked these up and loaded the tenant models. One evicted in
+    # between is answered by the shared model rather than loaded again in the batching thread
+    if not TENANT_MODELS:
+        return trainer.model.predict(prediction_request, cache=prediction_cache, lookup=False)
+    results = [None] * len(prediction_request)
+    for device_id, indexes in by_device(prediction_request).items():
+        predictions = serving_model(device_id, load=False).predict([prediction_request[i] for i in indexes],
+                                                                   cache=prediction_cache, lookup=False)
+        for i, prediction in zip(indexes, predictions):
+            results[i] = prediction
+    return results
+
+
+# Concurrent predict calls share forward passes; the serving snapshot is resolved again at batch time
+coalescer = PredictCoalescer(
+    predict_routed,
+    lookup_fn=cached_predictions,
+    window_ms=float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5")),
+    max_batch_size=int(os.getenv("PREDICT_MAX_BATCH_SIZE", "64"))
+)
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins
 scheduler = APScheduler()
-bq = BigQueryI()
-load_dotenv()
+bq = BigQueryI(
+    buffered=os.getenv("BIGQUERY_BUFFERED", "true").lower() == "true",
+    max_rows=int(os.getenv("BIGQUERY_FLUSH_ROWS", "500")),
+    max_interval=float(os.getenv("BIGQUERY_FLUSH_SECONDS", "5")),
+    device_column=os.getenv("BIGQUERY_DEVICE_COLUMN"),
+    ingest_column=os.getenv("BIGQUERY_INGEST_COLUMN")
+)
+# Flush buffered rows on shutdown
+atexit.register(bq.close)
+
+
+def refresh_latest_position(device_id=None):
+    """Confirm latest fixes against BigQuery, which other instances may also write to.
+
+    Only the given device's, or every device's. Without a device column every row is the default device's.
+    """
+    if not bq.device_column:
+        device_id = DEFAULT_DEVICE
+    if device_id is None:
+        for device, row in bq.fetch_latest_per_device().items():
+            latest_positions.update(device, row)
+        return
+    rows = bq.fetch_recent_data(limit=1, device_id=device_id)
+    if rows:
+        latest_positions.update(device_id, rows[0])
+
+
+# Latest fix per device, written by the insert endpoints and seeded from BigQuery at startup. It is
+# per process, so another worker's or instance's fixes are only picked up by re-checking BigQuery
+# once an entry is older than LAST_POSITION_MAX_AGE_SECONDS. Unset, entries are never re-checked,
+# which is right for a single worker; gunicorn.conf.py sets it when running several
+max_age = os.getenv("LAST_POSITION_MAX_AGE_SECONDS")
+latest_positions = LatestPositionStore(max_age=float(max_age) if max_age else None)
+
+# Local columnar copy of the location table; each refresh only pulls rows it has not seen
+location_cache = LocationCache(
+    bq,
+    cache_dir=os.getenv("LOCATION_CACHE_DIR", "/tmp/bishop-location-cache"),
+    reconcile_interval=float(os.getenv("LOCATION_RECONCILE_HOURS", "6")) * 3600
+)
+TRAINING_HISTORY_ROWS = int(os.getenv("TRAINING_HISTORY_ROWS")) if os.getenv("TRAINING_HISTORY_ROWS") else None
+
 
 # Scheduled Task
 @scheduler.task('interval', id='training_job', seconds=int(os.getenv("COORDINATES_CRON"))) 
 def scheduled_job():
-    print("Running scheduled job to fetch data from BigQuery...")
-    rows = bq.fetch_recent_data()
-    processed_rows = []
-
-    for row in rows:
-        longitude, latitude = map(float, row['coordinates'].split())
-        processed_rows.append({
-        "timestamp": row["timestamp"],
-        "latitude": latitude,
-        "longitude": longitude
-        })
-    # Convert processed_rows to a DataFrame
-    processed_rows = pd.DataFrame(processed_rows)
-    # Ensure the timestamp column is in datetime format
-    processed_rows['timestamp'] = pd.to_datetime(processed_rows['timestamp'])
-    bishop.process_and_train(processed_rows)
-    # bishop.save_model(base_path='~/MODEL')
+    if not model_ready.is_set():
+        print("Model is still loading, skipping this training run")
+        return
+    print("Refreshing the local location cache from BigQuery...")
+    location_cache.refresh()
+    train_shared_model()
+    if TENANT_MODELS:
+        train_tenant_models()
+
+
+def training_rows(**kwargs):
+    """Cached fixes to train on, with device_id when the table has a device column. kwargs go to LocationCache.frame."""
+    rows = location_cache.frame(**kwargs)
+    return rows[TRAINING_COLUMNS + ["device_id"]] if "device_id" in rows.columns else rows[TRAINING_COLUMNS]
+
+
+def record_observations(rows):
+    """Top up the serving model's rolling histories, each device's from its own fixes."""
+    if "device_id" not in rows.columns:
+        trainer.model.record_observations(rows)
+        return
+    for device_id, fixes in rows.groupby(rows["device_id"].fillna(DEFAULT_DEVICE)):
+        trainer.model.record_observations(fixes[TRAINING_COLUMNS], device_id)
+
+
+def train_shared_model():
+    model = trainer.model
+    if model.trained_until is None or model.full_retrain_due(FULL_RETRAIN_INTERVAL):
+        full_retrain()
+        return
+
+    new_rows = training_rows(since=model.trained_until)
+    if new_rows.empty:
+        print("No new rows since the last training run")
+        return
+    record_observations(new_rows)
+    if not model.supports_fine_tune:
+        # Backends without incremental updates are simply rebuilt on the full history
+        full_retrain()
+        return
+    if model.detect_drift(new_rows):
+        print("New rows fall outside the fitted coordinate range, retraining from scratch")
+        full_retrain()
+        return
+
+    # Include the rows just before the watermark so the first new windows have full context
+    if model.context_span is not None:
+        context_rows = training_rows(since=model.trained_until - model.context_span, until=model.trained_until)
+    else:
+        context_rows = training_rows(until=model.trained_until, limit=model.sequence_length)
+    trainer.fine_tune(pd.concat([context_rows, new_rows], ignore_index=True))
+
+
+def full_retrain():
+    # Backends that cut windows from the rows (the LSTM) keep each device's rows apart
+    processed_rows = training_rows(limit=TRAINING_HISTORY_ROWS)
+    # Top up the rolling history with anything the inserts have not already recorded
+    record_observations(processed_rows)
+    # Train out of process; predictions keep using the current snapshot until the new one is swapped in
+    trainer.retrain(processed_rows)
+
+
+def train_tenant_models():
+    """Train or fine-tune every device with at least TENANT_MIN_ROWS cached rows, across the tenant training pool."""
+    rows = location_cache.frame(limit=TRAINING_HISTORY_ROWS)
+    if "device_id" not in rows.columns:
+        print("Per-device models need BIGQUERY_DEVICE_COLUMN, skipping tenant training")
+        return
+    counts = rows["device_id"].value_counts()
+    tenants = [device_id for device_id, count in counts.items()
+               if count >= TENANT_MIN_ROWS and valid_tenant_id(device_id)]
+    frames = {device_id: rows.loc[rows["device_id"] == device_id, TRAINING_COLUMNS].reset_index(drop=True)
+              for device_id in tenants}
+    trained = tenant_trainer.train_all(frames)
+    print(f"Trained {len(trained)} of {len(frames)} tenant models")
 
 
 # Run prediction
 @app.route('/model/coordinates/predict', methods=['GET', 'POST'])
 def predict_coordinates():
-    data = request.json
-    prediction_request = data.get('prediction_request', [])
-    predictions = bishop.predict(prediction_request)
+    if not model_ready.is_set():
+        return jsonify({"error": "Model is loading"}), 503
+    with stage_timer("predict"):
+        with stage_timer("request_parse"):
+            data = request.json
+            prediction_request = data.get('prediction_request', [])
+        predictions = coalescer.predict(prediction_request)
     return jsonify(predictions), 200
 
 
-# Get all coordinates
+# Micro-batching and result cache statistics for the predict endpoint
+@app.route('/model/coordinates/predict/stats', methods=['GET'])
+def predict_stats():
+    return jsonify({
+        "batching": coalescer.stats(),
+        "cache": prediction_cache.stats(),
+        "registry": registry.stats()
+    }), 200
+
+
+def age_seconds(timestamp):
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return (pd.Timestamp.now(tz="UTC") - timestamp).total_seconds()
+
+
+def render_metrics():
+    """Prometheus text exposition of this worker process's stage latencies, model, caches and memory."""
+    model = trainer.model
+    caches = [("prediction", prediction_cache.stats())]
+    if getattr(model, "feature_cache", None) is not None:
+        caches.append(("features", model.feature_cache.stats()))
+    batching = coalescer.stats()
+    tenants = registry.stats()
+
+    lines = STAGE_SECONDS.render()
+    lines += render_metric("bishop_model_ready", "Whether the first model load has finished.", "gauge",
+                           [(None, model_ready.is_set())])
+    lines += render_metric("bishop_model_version", "Version of the serving shared model.", "gauge",
+                           [({"backend": model.backend}, model.version)])
+    data_age = age_seconds(model.trained_until)
+    if data_age is not None:
+        lines += render_metric("bishop_model_data_age_seconds", "Time since the newest fix the serving model was trained on.",
+                               "gauge", [(None, data_age)])
+    train_age = age_seconds(model.last_full_train)
+    if train_age is not None:
+        lines += render_metric("bishop_model_full_train_age_seconds", "Time since the serving model was last trained from scratch.",
+                               "gauge", [(None, train_age)])
+    lines += render_metric("bishop_cache_hits_total", "Cache lookups that found an entry.", "counter",
+                           [({"cache": name}, stats["hits"]) for name, stats in caches])
+    lines += render_metric("bishop_cache_misses_total", "Cache lookups that found no entry.", "counter",
+                           [({"cache": name}, stats["misses"]) for name, stats in caches])
+    lines += render_metric("bishop_cache_hit_ratio", "Fraction of cache lookups that hit, since startup.", "gauge",
+                           [({"cache": name}, stats["hit_rate"]) for name, stats in caches])
+    lines += render_metric("bishop_cache_entries", "Entries currently held by each cache.", "gauge",
+                           [({"cache": name}, stats["size"]) for name, stats in caches])
+    lines += render_metric("bishop_predict_batches_total", "Forward-pass batches formed by the predict coalescer.",
+                           "counter", [(None, batching["batches"])])
+    lines += render_metric("bishop_predict_items_total", "Prediction items answered through the coalescer.", "counter",
+                           [(None, batching["items"])])
+    lines += render_metric("bishop_predict_queue_depth", "Predict calls waiting for a batch.", "gauge",
+                           [(None, batching["queue_depth"])])
+    lines += render_metric("bishop_tenant_models_loaded", "Per-device models held in memory.", "gauge",
+                           [(None, tenants["loaded"])])
+    lines += render_metric("bishop_tenant_models_memory_bytes", "Estimated memory held by per-device models.", "gauge",
+                           [(None, tenants["memory_bytes"])])
+    lines += render_metric("bishop_tenant_model_evictions_total", "Per-device models evicted from memory.", "counter",
+                           [(None, tenants["evictions"])])
+    if bq.buffer is not None:
+        lines += render_metric("bishop_bigquery_pending_rows", "Rows waiting in the BigQuery insert buffer.", "gauge",
+                               [(None, bq.buffer.pending())])
+        lines += render_metric("bishop_bigquery_dropped_rows_total", "Rows dropped after exhausting insert retries.",
+                               "counter", [(None, bq.buffer.dropped)])
+    lines += render_metric("process_resident_memory_bytes", "Resident memory size in bytes.", "gauge",
+                           [(None, resident_memory_bytes())])
+    return "\n".join(lines) + "\n"
+
+
+# Prometheus metrics. Every gunicorn worker keeps its own, so scrape each worker or expect per-process values
+@app.route('/model/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Get the latest coordinates
 @app.route('/model/coordinates/last', methods=['GET'])
 def get_last_coordinates():
+    device_id = request.args.get('device_id', DEFAULT_DEVICE)
     try:
-        # Fetch a smaller number of coordinates for the GET endpoint
-        coordinates = bq.fetch_recent_data(limit=1)
-        return jsonify(coordinates), 200
+        if latest_positions.is_stale(device_id):
+            refresh_latest_position(device_id)
+        latest = latest_positions.get(device_id)
+        return jsonify([latest] if latest else []), 200
     except Exception as e:
         return jsonify({"error": f"Failed to retrieve coordinates: {str(e)}"}), 500
 
 
+def parse_fix(fix, default_timestamp):
+    """Validate a posted fix and return it ready to insert. Raises ValueError saying what is wrong.
+
+    Everything is checked before anything is written, so a rejected request leaves nothing behind
+    for the client's retry to duplicate.
+    """
+    if not isinstance(fix, dict):
+        raise ValueError("expected an object with latitude and longitude")
+    coordinates = {}
+    for name, bound in (("latitude", 90), ("longitude", 180)):
+        value = fix.get(name)
+        if value is None or isinstance(value, bool):
+            raise ValueError(f"{name} is required")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a number")
+        if not -bound <= value <= bound:
+            raise ValueError(f"{name} must be between -{bound} and {bound}")
+        coordinates[name] = value
+    timestamp = fix.get("timestamp") or default_timestamp
+    try:
+        # Numbers would be read as nanoseconds since the epoch
+        timestamp = pd.Timestamp(timestamp) if isinstance(timestamp, str) else pd.NaT
+    except ValueError:
+        timestamp = pd.NaT
+    if pd.isna(timestamp):
+        raise ValueError("timestamp must be an ISO 8601 date and time")
+    return {"id": str(uuid.uuid4()), "timestamp": timestamp.isoformat(), **coordinates}
+
+
 # Insert coordinate
 @app.route('/model/coordinates', methods=['POST'])
 def add_coordinates():
     data = request.json
-    latitude = data.get('latitude')
-    longitude = data.get('longitude')
-
-    if latitude is None or longitude is None:
+    if not isinstance(data, dict):
         return jsonify({"error": "Invalid input"}), 400
-    errors = bq.insert_coordinates(latitude, longitude)
+    device_id = data.get('device_id', DEFAULT_DEVICE)
+    # The server's clock stamps single fixes
+    try:
+        fix = parse_fix({"latitude": data.get('latitude'), "longitude": data.get('longitude')},
+                        datetime.now().isoformat())
+    except ValueError as e:
+        return jsonify({"error": "Invalid input", "details": str(e)}), 400
+    errors = bq.insert_many([{**fix, "device_id": device_id}])
     if errors:
         return jsonify({"error": "Failed to insert data into BigQuery", "details": errors}), 500
 
+    latest_positions.update(device_id, {
+        "id": fix["id"],
+        "timestamp": fix["timestamp"],
+        "coordinates": f"{fix['longitude']} {fix['latitude']}"
+    })
+
+    trainer.model.record_observations(pd.DataFrame({
+        "timestamp": [pd.Timestamp(fix["timestamp"])],
+        "latitude": [fix["latitude"]],
+        "longitude": [fix["longitude"]]
+    }), device_id)
+
     return jsonify({"message": "Coordinates added successfully"}), 201
 
+
+# Insert many coordinates at once, e.g. a backlog uploaded by the mobile background task
+@app.route('/model/coordinates/batch', methods=['POST'])
+def add_coordinates_batch():
+    data = request.json or {}
+    fixes = data.get('coordinates')
+    device_id = data.get('device_id', DEFAULT_DEVICE)
+
+    if not isinstance(fixes, list) or not fixes:
+        return jsonify({"error": "Invalid input"}), 400
+    now = datetime.now().isoformat()
+    parsed, invalid = [], []
+    for index, fix in enumerate(fixes):
+        try:
+            parsed.append({**parse_fix(fix, now), "device_id": device_id})
+        except ValueError as e:
+            invalid.append({"index": index, "message": str(e)})
+    # All or nothing: a partly inserted batch would be inserted again when the client retries it
+    if invalid:
+        return jsonify({"error": "Invalid input", "details": invalid}), 400
+    fixes = parsed
+    errors = bq.insert_many(fixes)
+    if errors:
+        return jsonify({"error": "Failed to insert data into BigQuery", "details": errors}), 500
+
+    observations = pd.DataFrame(fixes)
+    observations['timestamp'] = pd.to_datetime(observations['timestamp'], utc=True, format='ISO8601')
+    trainer.model.record_observations(observations, device_id)
+    latest = fixes[int(observations['timestamp'].to_numpy().argmax())]
+    latest_positions.update(device_id, {
+        "id": latest["id"],
+        "timestamp": latest["timestamp"],
+        "coordinates": f"{latest['longitude']} {latest['latitude']}"
+    })
+
+    return jsonify({"message": f"{len(fixes)} coordinates added successfully"}), 201
+
 # Test endpoint
 @app.route('/model/hello', methods=["GET"])
 def hello():
     return jsonify({"message": "Hello World from the Model Server"}), 200
 
+
+# Health check; answers while the model is still loading
+@app.route('/model/health', methods=["GET"])
+def health():
+    return jsonify({
+        "status": "ok",
+        "model_ready": model_ready.is_set(),
+        "model_version": trainer.model.version
+    }), 200
+
+def poll_published_models():
+    """Serving processes that do not train pick up snapshots published by the one that does."""
+    interval = float(os.getenv("MODEL_RELOAD_SECONDS", "60"))
+    while True:
+        time.sleep(interval)
+        try:
+            trainer.reload_latest()
+            if TENANT_MODELS:
+                registry.refresh()
+        except Exception as e:
+            print(f"Failed to reload the published model: {str(e)}")
+
+
+def warm_up():
+    load_published_model()
+    try:
+        refresh_latest_position()
+    except Exception as e:
+        print(f"Failed to seed the latest position: {str(e)}")
+
+
+def start_worker(run_scheduler=True):
+    """Per-process startup: warm up in the background and start either the training scheduler or model polling."""
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if run_scheduler:
+        scheduler.init_app(app)
+        scheduler.start()
+    else:
+        threading.Thread(target=poll_published_models, name="model-reloader", daemon=True).start()
+
+
 if __name__ == '__main__':
-    scheduler.init_app(app)
-    scheduler.start()
+    start_worker()
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
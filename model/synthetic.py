@@ -0,0 +1,92 @@
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _offset(lat: np.ndarray, km_north: np.ndarray, km_east: np.ndarray):
+    """(dlat, dlon) in degrees for displacements in kilometers at latitude lat."""
+    return km_north / KM_PER_DEGREE_LAT, km_east / (KM_PER_DEGREE_LAT * np.cos(np.radians(lat)))
+
+
+def _trip(minute: np.ndarray, leave: np.ndarray, duration: np.ndarray, come_back: np.ndarray) -> np.ndarray:
+    """Fraction of the way from A to B: 0 before leave, 1 once there, back to 0 after the trip home from come_back."""
+    there = np.clip((minute - leave) / duration, 0, 1)
+    back = 1 - np.clip((minute - come_back) / duration, 0, 1)
+    return np.where(minute < come_back, there, back)
+
+
+def generate_commute_data(num_users: int = 10, days: int = 14, interval: pd.Timedelta = pd.Timedelta(minutes=10),
+                          start: Union[str, pd.Timestamp] = "2025-01-06", base_lat: float = 40.0190,
+                          base_lon: float = -105.2747, spread_km: float = 15.0, noise_m: float = 15.0,
+                          drop_rate: float = 0.0, seed: Optional[int] = None) -> pd.DataFrame:
+    """Home-work commute trajectories for num_users devices, one fix per interval for `days` days.
+
+    Every user has a home, a workplace 3-20 km away and a weekend spot, all within spread_km of
+    the base position. On weekdays they leave home around their own usual time (spread from
+    7:00 to 9:30, plus a few minutes of daily variation), travel at 20-50 km/h, and leave work
+    about nine hours later. On a weekend day they make a late-morning trip to their weekend spot
+    with probability one half and otherwise stay home. Fixes carry noise_m of GPS noise and a
+    drop_rate fraction of them is removed at random.
+
+    Everything is computed on (users, days, steps) arrays, so millions of rows take seconds. The
+    same seed gives the same data. Returns timestamp (naive, taken as UTC like the rest of the
+    model), latitude, longitude and a categorical device_id, ordered by timestamp then device.
+    """
+    rng = np.random.default_rng(seed)
+    steps = int(pd.Timedelta(days=1) / interval)
+    minute = (np.arange(steps) * interval.total_seconds() / 60)[None, None, :]
+    start = pd.Timestamp(start)
+    weekend = ((start.dayofweek + np.arange(days)) % 7 >= 5)[None, :, None]
+
+    def place(origin_lat, origin_lon, min_km, max_km):
+        distance = rng.uniform(min_km, max_km, num_users)
+        bearing = rng.uniform(0, 2 * np.pi, num_users)
+        dlat, dlon = _offset(origin_lat, distance * np.cos(bearing), distance * np.sin(bearing))
+        return origin_lat + dlat, origin_lon + dlon, distance
+
+    home_lat, home_lon, _ = place(np.full(num_users, base_lat), np.full(num_users, base_lon), 0, spread_km)
+    work_lat, work_lon, commute_km = place(home_lat, home_lon, 3, 20)
+    spot_lat, spot_lon, spot_km = place(home_lat, home_lon, 1, 10)
+    speed_km_per_minute = rng.uniform(20, 50, num_users) / 60
+
+    # Per-user habits with per-day variation, shaped (users, days, 1) to broadcast over the steps
+    def daily(mean, user_spread, day_spread):
+        habit = rng.normal(mean, user_spread, (num_users, 1, 1))
+        return habit + rng.normal(0, day_spread, (num_users, days, 1))
+
+    commute_minutes = (commute_km / speed_km_per_minute)[:, None, None]
+    leave_home = np.clip(daily(8 * 60, 40, 10), 7 * 60, 9.5 * 60)
+    leave_work = leave_home + commute_minutes + daily(9 * 60, 20, 15)
+    spot_minutes = (spot_km / speed_km_per_minute)[:, None, None]
+    spot_arrive = daily(10.5 * 60, 30, 20)
+    spot_leave = spot_arrive + spot_minutes + rng.uniform(60, 180, (num_users, days, 1))
+    goes_out = rng.random((num_users, days, 1)) < 0.5
+
+    to_work = _trip(minute, leave_home, commute_minutes, leave_work)
+    to_spot = _trip(minute, spot_arrive - spot_minutes, spot_minutes, spot_leave) * goes_out
+    weekday = ~weekend
+    latitude = (home_lat[:, None, None] + weekday * to_work * (work_lat - home_lat)[:, None, None]
+                + weekend * to_spot * (spot_lat - home_lat)[:, None, None])
+    longitude = (home_lon[:, None, None] + weekday * to_work * (work_lon - home_lon)[:, None, None]
+                 + weekend * to_spot * (spot_lon - home_lon)[:, None, None])
+
+    noise_km = noise_m / 1000
+    dlat, dlon = _offset(latitude, rng.normal(0, noise_km, latitude.shape), rng.normal(0, noise_km, latitude.shape))
+    # Time-major order, the way fixes arrive in the location table
+    latitude = (latitude + dlat).reshape(num_users, -1).T.ravel()
+    longitude = (longitude + dlon).reshape(num_users, -1).T.ravel()
+    total_steps = days * steps
+    offsets = np.repeat(np.arange(total_steps, dtype=np.int64) * interval.value, num_users)
+    codes = np.tile(np.arange(num_users), total_steps)
+
+    keep = rng.random(len(codes)) >= drop_rate if drop_rate > 0 else slice(None)
+    names = [f"user-{i:0{max(4, len(str(num_users - 1)))}d}" for i in range(num_users)]
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(start.value + offsets[keep]),
+        'latitude': latitude[keep],
+        'longitude': longitude[keep],
+        'device_id': pd.Categorical.from_codes(codes[keep], names),
+    })
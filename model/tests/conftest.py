@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The model service is a directory of flat modules run from that directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,129 @@
+import threading
+import time
+
+from bigquery import BigQueryI, FakeBigQueryClient, InsertBuffer
+
+
+def rows(count, start=0):
+    return [{"id": str(i)} for i in range(start, start + count)]
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_fake_client_rejects_listed_indexes_on_the_first_call_only():
+    client = FakeBigQueryClient(fail_indexes={1})
+    errors = client.insert_rows_json("table", rows(3))
+    assert [error["index"] for error in errors] == [1]
+    assert client.insert_rows_json("table", rows(1, start=1)) == []
+    assert [row["id"] for row in client.rows] == ["0", "2", "1"]
+    assert client.calls == 2
+
+
+def test_buffer_flushes_once_max_rows_are_pending():
+    client = FakeBigQueryClient()
+    buffer = InsertBuffer(lambda batch: client.insert_rows_json("table", batch), max_rows=3, max_interval=60)
+    buffer.add(rows(2))
+    time.sleep(0.05)
+    assert client.rows == []
+    buffer.add(rows(1, start=2))
+    assert wait_for(lambda: len(client.rows) == 3)
+    assert client.calls == 1
+    assert buffer.pending() == 0
+
+
+def test_buffer_flushes_after_max_interval():
+    client = FakeBigQueryClient()
+    buffer = InsertBuffer(lambda batch: client.insert_rows_json("table", batch), max_rows=100, max_interval=0.05)
+    buffer.add(rows(1))
+    assert wait_for(lambda: len(client.rows) == 1)
+    assert buffer.inserted == 1
+
+
+def test_flush_sends_at_most_max_rows_per_call():
+    client = FakeBigQueryClient()
+    buffer = InsertBuffer(lambda batch: client.insert_rows_json("table", batch), max_rows=4, max_interval=60)
+    buffer._pending = [(row, 0) for row in rows(10)]
+    assert buffer.flush() == []
+    assert client.calls == 3
+    assert [row["id"] for row in client.rows] == [str(i) for i in range(10)]
+
+
+def test_rejected_rows_are_retried_ahead_of_newer_rows():
+    client = FakeBigQueryClient(fail_indexes={0, 2})
+    buffer = InsertBuffer(lambda batch: client.insert_rows_json("table", batch), max_rows=100, max_interval=60,
+                          retry_delay=0)
+    buffer._pending = [(row, 0) for row in rows(3)]
+    assert buffer.flush() == []
+    assert [row["id"] for row in client.rows] == ["1", "0", "2"]
+    assert (buffer.inserted, buffer.dropped) == (3, 0)
+
+
+def test_rows_are_dropped_after_max_retries():
+    calls = []
+
+    def failing_insert(batch):
+        calls.append(len(batch))
+        raise ConnectionError("unreachable")
+
+    buffer = InsertBuffer(failing_insert, max_rows=100, max_interval=60, max_retries=3, retry_delay=0)
+    buffer._pending = [(row, 0) for row in rows(2)]
+    assert buffer.flush() == rows(2)
+    assert calls == [2, 2, 2]
+    assert (buffer.inserted, buffer.dropped) == (0, 2)
+    assert buffer.pending() == 0
+
+
+def test_close_waits_for_an_insert_the_background_thread_has_in_flight():
+    started, release = threading.Event(), threading.Event()
+    client = FakeBigQueryClient(fail_indexes={0})
+
+    def slow_insert(batch):
+        started.set()
+        release.wait(2)
+        return client.insert_rows_json("table", batch)
+
+    buffer = InsertBuffer(slow_insert, max_rows=2, max_interval=60, retry_delay=0)
+    buffer.add(rows(2))
+    assert started.wait(2)
+
+    closer = threading.Thread(target=buffer.close)
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive(), "close returned while rows were still being sent"
+    release.set()
+    closer.join(2)
+    assert not closer.is_alive()
+    # The rejected row was retried before close returned
+    assert sorted(row["id"] for row in client.rows) == ["0", "1"]
+    assert buffer.pending() == 0
+
+
+def test_close_flushes_rows_added_just_before_it():
+    client = FakeBigQueryClient()
+    buffer = InsertBuffer(lambda batch: client.insert_rows_json("table", batch), max_rows=100, max_interval=60)
+    buffer.add(rows(5))
+    buffer.close()
+    assert len(client.rows) == 5
+    assert not buffer._thread.is_alive()
+
+
+def test_buffered_inserts_reach_the_client_as_table_rows():
+    client = FakeBigQueryClient()
+    bq = BigQueryI(client=client, buffered=True, max_rows=100, max_interval=60, device_column="device",
+                   ingest_column="ingested")
+    assert bq.insert_many([{"latitude": 40.0, "longitude": -105.0, "timestamp": "2025-01-06T08:00:00",
+                            "device_id": "phone", "id": "a"}]) == []
+    bq.close()
+    (row,) = client.rows
+    assert row["id"] == "a"
+    assert row["coordinates"] == "-105.0 40.0"
+    assert row["timestamp"] == "2025-01-06T08:00:00"
+    assert row["device"] == "phone"
+    assert row["ingested"].endswith("+00:00")
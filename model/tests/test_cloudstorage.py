@@ -0,0 +1,64 @@
+import os
+
+from cloudstorage import LocalStorageI
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_upload_then_download_round_trips_nested_blob_names(tmp_path):
+    storage = LocalStorageI(str(tmp_path / "bucket"))
+    write(tmp_path / "source.txt", "weights")
+    storage.upload_file(str(tmp_path / "source.txt"), "tenants/a/bishop-v1.tar.gz")
+    storage.download_file("tenants/a/bishop-v1.tar.gz", str(tmp_path / "copy.txt"))
+    assert read(tmp_path / "copy.txt") == "weights"
+
+
+def test_upload_overwrites_an_existing_blob(tmp_path):
+    storage = LocalStorageI(str(tmp_path / "bucket"))
+    for content in ("v1", "v2"):
+        write(tmp_path / "manifest.json", content)
+        storage.upload_file(str(tmp_path / "manifest.json"), "bishop-latest.json")
+    storage.download_file("bishop-latest.json", str(tmp_path / "copy.json"))
+    assert read(tmp_path / "copy.json") == "v2"
+
+
+def test_downloading_a_missing_blob_leaves_no_file(tmp_path):
+    # ModelArtifactStore relies on this to tell that nothing has been published yet
+    storage = LocalStorageI(str(tmp_path / "bucket"))
+    storage.download_file("bishop-latest.json", str(tmp_path / "manifest.json"))
+    assert not os.path.exists(tmp_path / "manifest.json")
+
+
+def test_list_files_matches_on_the_blob_name_prefix(tmp_path):
+    storage = LocalStorageI(str(tmp_path / "bucket"))
+    write(tmp_path / "source", "")
+    for name in ("bishop-v1.tar.gz", "bishop-v2.tar.gz", "bishop-latest.json", "tenants/bishop-v3.tar.gz",
+                 "other-v1.tar.gz"):
+        storage.upload_file(str(tmp_path / "source"), name)
+    assert storage.list_files("bishop-v") == ["bishop-v1.tar.gz", "bishop-v2.tar.gz"]
+    assert storage.list_files("tenants/") == ["tenants/bishop-v3.tar.gz"]
+    assert len(storage.list_files("")) == 5
+
+
+def test_delete_file_removes_the_blob_and_ignores_missing_ones(tmp_path):
+    storage = LocalStorageI(str(tmp_path / "bucket"))
+    write(tmp_path / "source", "")
+    storage.upload_file(str(tmp_path / "source"), "bishop-v1.tar.gz")
+    storage.delete_file("bishop-v1.tar.gz")
+    storage.delete_file("bishop-v1.tar.gz")
+    assert storage.list_files("") == []
+
+
+def test_root_dir_expands_the_home_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    storage = LocalStorageI("~/MODEL")
+    assert storage.root_dir == str(tmp_path / "MODEL")
+    assert os.path.isdir(tmp_path / "MODEL")
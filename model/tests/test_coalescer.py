@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from coalescer import PredictCoalescer
+
+
+class RecordingPredict:
+    """predict_fn that echoes each item's value and records the batches it was called with."""
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    def __call__(self, items):
+        self.batches.append([item["value"] for item in items])
+        time.sleep(self.delay)
+        if any(item.get("bad") for item in items):
+            raise ValueError("bad request")
+        return [{"result": item["value"]} for item in items]
+
+
+def call_concurrently(coalescer, requests):
+    """Run one predict per request at the same moment; returns each caller's result or exception."""
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def call(i):
+        barrier.wait()
+        try:
+            results[i] = coalescer.predict(requests[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_callers_share_one_batch_and_get_their_own_results():
+    predict = RecordingPredict()
+    coalescer = PredictCoalescer(predict, window_ms=200, max_batch_size=64)
+    requests = [[{"value": i}, {"value": i + 100}] for i in range(4)]
+    results = call_concurrently(coalescer, requests)
+    assert results == [[{"result": i}, {"result": i + 100}] for i in range(4)]
+    assert len(predict.batches) == 1
+    assert sorted(predict.batches[0]) == sorted(value for i in range(4) for value in (i, i + 100))
+    stats = coalescer.stats()
+    assert (stats["batches"], stats["requests"], stats["items"]) == (1, 4, 8)
+
+
+def test_a_full_batch_does_not_wait_out_the_window():
+    predict = RecordingPredict()
+    coalescer = PredictCoalescer(predict, window_ms=5000, max_batch_size=2)
+    start = time.monotonic()
+    assert coalescer.predict([{"value": 1}, {"value": 2}]) == [{"result": 1}, {"result": 2}]
+    assert time.monotonic() - start < 1
+
+
+def test_a_failing_request_only_fails_its_own_caller():
+    predict = RecordingPredict()
+    coalescer = PredictCoalescer(predict, window_ms=200)
+    good, bad = call_concurrently(coalescer, [[{"value": 1}], [{"value": 2, "bad": True}]])
+    assert good == [{"result": 1}]
+    assert isinstance(bad, ValueError)
+
+
+def test_a_lone_failing_request_raises_to_its_caller():
+    coalescer = PredictCoalescer(RecordingPredict(), window_ms=1)
+    with pytest.raises(ValueError):
+        coalescer.predict([{"value": 1, "bad": True}])
+
+
+def test_empty_requests_never_reach_predict_fn():
+    predict = RecordingPredict()
+    coalescer = PredictCoalescer(predict, window_ms=1)
+    assert coalescer.predict([]) == []
+    assert predict.batches == []
+
+
+def test_lookup_hits_skip_the_batching_window():
+    predict = RecordingPredict()
+    coalescer = PredictCoalescer(predict, window_ms=5000, lookup_fn=lambda items: [{"cached": item["value"]} for item in items])
+    start = time.monotonic()
+    assert coalescer.predict([{"value": 1}, {"value": 2}]) == [{"cached": 1}, {"cached": 2}]
+    assert time.monotonic() - start < 1
+    assert predict.batches == []
+    assert coalescer.stats()["looked_up_items"] == 2
+
+
+def test_only_lookup_misses_are_predicted_and_results_keep_request_order():
+    predict = RecordingPredict()
+    cached = {2: {"cached": 2}}
+    coalescer = PredictCoalescer(predict, window_ms=1, lookup_fn=lambda items: [cached.get(item["value"]) for item in items])
+    results = coalescer.predict([{"value": 1}, {"value": 2}, {"value": 3}])
+    assert results == [{"result": 1}, {"cached": 2}, {"result": 3}]
+    assert predict.batches == [[1, 3]]
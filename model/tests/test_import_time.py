@@ -0,0 +1,7 @@
+from check_import_time import HEAVY_MODULES, profile_server_import
+
+
+def test_server_import_does_not_load_heavy_dependencies():
+    cumulative, total = profile_server_import()
+    assert total > 0
+    assert [name for name in HEAVY_MODULES if name in cumulative] == []
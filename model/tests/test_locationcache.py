@@ -0,0 +1,120 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from bigquery import BigQueryI, FakeBigQueryClient
+from locationcache import LocationCache
+
+START = pd.Timestamp("2025-01-06", tz="UTC")
+
+
+class FakeTable(BigQueryI):
+    """BigQueryI whose reads filter the rows FakeBigQueryClient recorded the way its queries do."""
+
+    def _table(self):
+        rows = pd.DataFrame(self.client.rows, columns=["id", "timestamp", "coordinates", "device", "ingested"])
+        coordinates = rows["coordinates"].str.split(" ", expand=True).astype(float)
+        table = pd.DataFrame({
+            "id": rows["id"],
+            "timestamp": pd.to_datetime(rows["timestamp"], utc=True, format="ISO8601"),
+            "latitude": coordinates[1] if len(rows) else [],
+            "longitude": coordinates[0] if len(rows) else [],
+        })
+        if self.device_column:
+            table["device_id"] = rows["device"]
+        if self.ingest_column:
+            table["ingested_at"] = pd.to_datetime(rows["ingested"], utc=True, format="ISO8601")
+        return table
+
+    def fetch_coordinates_frame(self, since=None, ingested_since=None, ids=None):
+        self.queries.append({"since": since, "ingested_since": ingested_since, "ids": ids})
+        table = self._table()
+        if since is not None:
+            table = table[table["timestamp"] > since]
+        if ingested_since is not None:
+            table = table[table["ingested_at"] > ingested_since]
+        if ids is not None:
+            table = table[table["id"].isin(ids)]
+        return table.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+    def fetch_ids(self):
+        return set(self._table()["id"])
+
+
+@pytest.fixture
+def table():
+    table = FakeTable(client=FakeBigQueryClient())
+    table.queries = []
+    return table
+
+
+def insert(table, minutes, prefix):
+    table.insert_many([
+        {"id": f"{prefix}{minute}", "timestamp": (START + pd.Timedelta(minutes=minute)).isoformat(),
+         "latitude": 40.0, "longitude": -105.0 - minute / 1000}
+        for minute in minutes
+    ])
+
+
+def test_rows_within_the_overlap_are_fetched_again_but_cached_once(table, tmp_path):
+    cache = LocationCache(table, str(tmp_path), overlap=pd.Timedelta(hours=1), reconcile_interval=None)
+    insert(table, range(0, 120, 10), "a")
+    assert cache.refresh() == 12
+    # Written late, but still within the hour looked back over
+    insert(table, [95, 125], "b")
+    assert cache.refresh() == 2
+    assert table.queries[-1]["since"] == START + pd.Timedelta(minutes=50)
+    assert cache.refresh() == 0
+    frame = cache.frame()
+    assert len(frame) == 14 and frame["id"].is_unique
+    assert frame["timestamp"].is_monotonic_increasing
+
+
+def test_reconcile_finds_a_backlog_older_than_the_watermark(table, tmp_path):
+    cache = LocationCache(table, str(tmp_path), overlap=pd.Timedelta(hours=1), reconcile_interval=3600)
+    insert(table, range(600, 720, 10), "a")
+    cache.refresh()
+    # A device uploading a day-old backlog, hours before the watermark minus the overlap
+    insert(table, range(0, 60, 10), "backlog")
+    assert cache.refresh() == 0
+    cache._last_reconcile -= 3600
+    assert cache.refresh() == 6
+    assert sorted(table.queries[-1]["ids"]) == [f"backlog{minute}" for minute in range(0, 60, 10)]
+    assert len(cache.frame()) == 18
+    assert cache.frame(until=START + pd.Timedelta(hours=1))["id"].str.startswith("backlog").all()
+
+
+def test_cache_read_back_from_disk_is_reconciled_on_its_first_refresh(table, tmp_path):
+    insert(table, range(600, 720, 10), "a")
+    LocationCache(table, str(tmp_path), reconcile_interval=3600).refresh()
+    insert(table, range(0, 30, 10), "backlog")
+    restarted = LocationCache(table, str(tmp_path), reconcile_interval=3600)
+    assert restarted.refresh() == 3
+
+
+def test_ingestion_watermark_picks_up_a_backlog_without_reconciling(tmp_path):
+    table = FakeTable(client=FakeBigQueryClient(), ingest_column="ingested")
+    table.queries = []
+    cache = LocationCache(table, str(tmp_path), reconcile_interval=None)
+    insert(table, range(600, 720, 10), "a")
+    cache.refresh()
+    insert(table, range(0, 60, 10), "backlog")
+    assert cache.refresh() == 6
+    assert table.queries[-1]["ingested_since"] is not None and table.queries[-1]["ids"] is None
+    assert cache.refresh() == 0
+    assert len(cache.frame()) == 18
+
+
+def test_parts_are_compacted_into_one_once_there_are_more_than_max_parts(table, tmp_path):
+    cache = LocationCache(table, str(tmp_path), max_parts=3, reconcile_interval=None)
+    for part in range(4):
+        insert(table, range(part * 100, part * 100 + 50, 10), f"p{part}-")
+        cache.refresh()
+    parts = glob.glob(os.path.join(str(tmp_path), "part-*.parquet"))
+    assert len(parts) == 1
+    restarted = LocationCache(table, str(tmp_path), reconcile_interval=None)
+    assert len(restarted.frame()) == 20 and restarted.frame()["id"].is_unique
+    # Parquet reads ids back as the string dtype
+    pd.testing.assert_frame_equal(restarted.frame(), cache.frame(), check_dtype=False)
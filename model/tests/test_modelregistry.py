@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cloudstorage import LocalStorageI
+from modelregistry import ModelRegistry, TenantTrainer
+from modelstore import ModelArtifactStore
+
+
+def fixes(hours, start="2025-01-06"):
+    timestamps = pd.date_range(start, periods=hours * 6, freq="10min", tz="UTC")
+    return pd.DataFrame({
+        "timestamp": timestamps,
+        "latitude": 40.0 + np.sin(np.arange(len(timestamps)) / 20) / 100,
+        "longitude": np.full(len(timestamps), -105.0),
+    })
+
+
+@pytest.fixture
+def registry(tmp_path):
+    remote = LocalStorageI(str(tmp_path / "bucket"))
+    return ModelRegistry(
+        lambda tenant_id: ModelArtifactStore(remote, str(tmp_path / "cache" / tenant_id), prefix=f"bishop-tenant-{tenant_id}"),
+        max_models=1
+    )
+
+
+@pytest.fixture
+def tenant_trainer(registry, tmp_path):
+    trainer = TenantTrainer(registry, str(tmp_path / "snapshots"), max_workers=1, backend="lookup")
+    yield trainer
+    trainer._executor.shutdown()
+
+
+def test_tenants_are_skipped_until_they_have_rows_after_their_snapshot(registry, tenant_trainer):
+    frame = fixes(24)
+    assert set(tenant_trainer.train_all({"a": frame})) == {"a"}
+    assert tenant_trainer.train_all({"a": frame}) == {}
+    newer = pd.concat([frame, fixes(1, start="2025-01-07 00:00")], ignore_index=True)
+    trained = tenant_trainer.train_all({"a": newer})
+    assert trained["a"].version == 2
+    assert registry.store("a").latest_version() == 2
+
+
+def test_training_replaces_loaded_tenants_without_evicting_them(registry, tenant_trainer):
+    tenant_trainer.train_all({"a": fixes(24), "b": fixes(24)})
+    served = registry.get("a")
+    assert served.version == 1
+    tenant_trainer.train_all({"a": fixes(25), "b": fixes(25)})
+    # Training b published it but did not push a, the one loaded tenant, out of the registry
+    assert registry.peek("b") is None
+    assert registry.peek("a").version == 2
+    assert registry.evictions == 0
+    assert registry.get("b").version == 2
@@ -0,0 +1,88 @@
+import json
+import os
+
+from cloudstorage import LocalStorageI
+from modelstore import ModelArtifactStore
+
+
+def snapshot(path, version):
+    os.makedirs(os.path.join(path, "weights"), exist_ok=True)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"backend": "lookup", "version": version}, f)
+    with open(os.path.join(path, "weights", "000.npy"), "wb") as f:
+        f.write(bytes([version]) * 64)
+    return str(path)
+
+
+def read_version(snapshot_path):
+    with open(os.path.join(snapshot_path, "meta.json")) as f:
+        return json.load(f)["version"]
+
+
+def test_fetch_latest_returns_the_newest_published_snapshot(tmp_path):
+    remote = LocalStorageI(str(tmp_path / "bucket"))
+    publisher = ModelArtifactStore(remote, str(tmp_path / "publisher"))
+    for version in (1, 2):
+        publisher.publish(snapshot(tmp_path / f"v{version}", version), version)
+
+    reader = ModelArtifactStore(remote, str(tmp_path / "reader"))
+    snapshot_path = reader.fetch_latest()
+    assert read_version(snapshot_path) == 2
+    with open(os.path.join(snapshot_path, "weights", "000.npy"), "rb") as f:
+        assert f.read() == bytes([2]) * 64
+    assert reader.latest_version() == 2
+    # A second fetch is answered from the verified cache
+    assert reader.fetch_latest() == snapshot_path
+
+
+def test_nothing_published_fetches_none(tmp_path):
+    store = ModelArtifactStore(LocalStorageI(str(tmp_path / "bucket")), str(tmp_path / "cache"))
+    assert store.fetch_latest() is None
+    assert store.latest_version() is None
+
+
+def test_corrupted_archive_is_rejected(tmp_path):
+    remote = LocalStorageI(str(tmp_path / "bucket"))
+    ModelArtifactStore(remote, str(tmp_path / "publisher")).publish(snapshot(tmp_path / "v1", 1), 1)
+    with open(tmp_path / "bucket" / "bishop-v1.tar.gz", "r+b") as f:
+        f.seek(20)
+        f.write(b"corrupted")
+
+    reader = ModelArtifactStore(remote, str(tmp_path / "reader"))
+    assert reader.fetch_latest() is None
+    assert not os.path.exists(tmp_path / "reader" / "bishop-v1")
+
+
+def test_corrupted_local_archive_is_downloaded_again(tmp_path):
+    remote = LocalStorageI(str(tmp_path / "bucket"))
+    store = ModelArtifactStore(remote, str(tmp_path / "cache"))
+    store.publish(snapshot(tmp_path / "v1", 1), 1)
+    with open(tmp_path / "cache" / "bishop-v1.tar.gz", "wb") as f:
+        f.write(b"truncated")
+    assert read_version(store.fetch_latest()) == 1
+
+
+def test_pruning_keeps_the_newest_versions_and_always_the_manifests(tmp_path):
+    remote = LocalStorageI(str(tmp_path / "bucket"))
+    store = ModelArtifactStore(remote, str(tmp_path / "cache"), keep_versions=2)
+    for version in (1, 2, 3, 4):
+        store.publish(snapshot(tmp_path / f"v{version}", version), version)
+    assert sorted(remote.list_files("bishop-v")) == ["bishop-v3.tar.gz", "bishop-v4.tar.gz"]
+
+    # Republishing an old version number, e.g. a rollback, must not prune the bundle it points at
+    store.publish(snapshot(tmp_path / "v2", 2), 2)
+    assert sorted(remote.list_files("bishop-v")) == ["bishop-v2.tar.gz", "bishop-v3.tar.gz", "bishop-v4.tar.gz"]
+    reader = ModelArtifactStore(remote, str(tmp_path / "reader"), keep_versions=1)
+    assert read_version(reader.fetch_latest()) == 2
+    store.publish(snapshot(tmp_path / "v5", 5), 5)
+    assert sorted(remote.list_files("bishop-v")) == ["bishop-v4.tar.gz", "bishop-v5.tar.gz"]
+
+
+def test_pruning_ignores_other_prefixes(tmp_path):
+    remote = LocalStorageI(str(tmp_path / "bucket"))
+    tenant = ModelArtifactStore(remote, str(tmp_path / "tenant"), prefix="bishop-tenant-a", keep_versions=1)
+    tenant.publish(snapshot(tmp_path / "t1", 1), 1)
+    shared = ModelArtifactStore(remote, str(tmp_path / "shared"), keep_versions=1)
+    for version in (1, 2):
+        shared.publish(snapshot(tmp_path / f"v{version}", version), version)
+    assert remote.list_files("bishop-tenant-a-v") == ["bishop-tenant-a-v1.tar.gz"]
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from cloudstorage import LocalStorageI
+from lookupmodel import LookupModel
+from modelstore import ModelArtifactStore
+from trainer import BackgroundTrainer
+
+
+def fixes(hours):
+    timestamps = pd.date_range("2025-01-06", periods=hours * 6, freq="10min", tz="UTC")
+    return pd.DataFrame({
+        "timestamp": timestamps,
+        "latitude": 40.0 + np.sin(np.arange(len(timestamps)) / 20) / 100,
+        "longitude": np.full(len(timestamps), -105.0),
+    })
+
+
+def test_retrain_numbers_past_the_published_version_when_serving_an_older_one(tmp_path):
+    store = ModelArtifactStore(LocalStorageI(str(tmp_path / "bucket")), str(tmp_path / "cache"))
+    published = LookupModel()
+    published.process_and_train(fixes(24))
+    published.version = 5
+    store.publish(published.save_model(str(tmp_path / "published")), 5)
+
+    # As after a failed boot fetch: the placeholder model is serving version 0
+    trainer = BackgroundTrainer(LookupModel(), str(tmp_path / "snapshots"), artifact_store=store)
+    try:
+        model = trainer.retrain(fixes(24))
+    finally:
+        trainer._executor.shutdown()
+    assert model.version == 6
+    assert store.latest_version() == 6
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from trajectory import detect_stay_points, haversine_distance
+
+
+def fixes(latitudes, seconds=60):
+    timestamps = pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(np.arange(len(latitudes)) * seconds, unit="s")
+    return pd.DataFrame({"timestamp": timestamps, "latitude": latitudes, "longitude": np.full(len(latitudes), -105.0)})
+
+
+def test_slow_walk_starts_a_stay_at_every_fix_out_of_range_of_its_anchor():
+    # About 10 m per fix: no single step leaves the radius, so only the drift from each anchor splits
+    latitudes = 40 + np.arange(2000) * 0.00009
+    labels, stays = detect_stay_points(fixes(latitudes), radius_m=100, min_dwell=pd.Timedelta(0))
+    anchors = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]]))
+    assert len(stays) == len(anchors) > 100
+    segments = np.split(np.arange(len(latitudes)), anchors[1:])
+    for segment in segments:
+        distance = haversine_distance(latitudes[segment[0]], -105.0, latitudes[segment], -105.0)
+        assert (distance <= 0.1).all()
+    for segment, following in zip(segments[:-1], segments[1:]):
+        assert haversine_distance(latitudes[segment[0]], -105.0, latitudes[following[0]], -105.0) > 0.1
+
+
+def test_only_stays_of_min_dwell_are_kept():
+    latitudes = np.concatenate([np.full(30, 40.0), 40.01 + np.arange(5) * 0.01, np.full(10, 40.1)])
+    labels, stays = detect_stay_points(fixes(latitudes), radius_m=100, min_dwell=pd.Timedelta(minutes=20))
+    assert len(stays) == 1
+    assert (labels[:30] == 0).all() and (labels[30:] == -1).all()
+    assert stays.loc[0, "fixes"] == 30
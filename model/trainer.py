@@ -0,0 +1,152 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from metrics import STAGE_SECONDS, stage_timer
+from modelstore import ModelArtifactStore
+from predictor import Predictor, backend_class, load_predictor
+
+
+def _lower_priority() -> None:
+    """Run the training worker at a lower CPU priority than the serving process."""
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+
+def train_snapshot(raw_df: pd.DataFrame, output_path: str, version: int, backend: str = "lstm",
+                   options: Optional[Dict[str, Any]] = None, base_path: Optional[str] = None) -> str:
+    """Train a model of the given backend and save it to output_path. Runs inside the worker process.
+
+    Without base_path a fresh model is built from options and trained from scratch; with it, the
+    snapshot at base_path is loaded and fine-tuned on raw_df instead.
+    """
+    with stage_timer("training"):
+        if base_path is None:
+            model = backend_class(backend)(**(options or {}))
+            model.process_and_train(raw_df)
+        else:
+            model = load_predictor(base_path)
+            model.fine_tune(raw_df)
+    model.version = version
+    return model.save_model(output_path)
+
+
+def train_snapshot_timed(*args, **kwargs) -> Tuple[str, Dict[str, list]]:
+    """train_snapshot, also returning the stage timings the worker recorded for the parent to merge."""
+    # Drop anything an earlier failed run left behind in this reused worker
+    STAGE_SECONDS.drain()
+    snapshot_path = train_snapshot(*args, **kwargs)
+    return snapshot_path, STAGE_SECONDS.drain()
+
+
+class BackgroundTrainer:
+    """Trains model snapshots in a separate process and atomically swaps them in when complete.
+
+    Requests keep being served by the current snapshot while a retrain runs. The new snapshot
+    shares the live history buffer, so no recorded observations are lost across the swap.
+    Each new snapshot is also published to artifact_store when one is given, and on_swap is
+    called with it once it is serving.
+    """
+
+    def __init__(self, model: Predictor, snapshot_dir: str, keep_snapshots: int = 2,
+                 artifact_store: Optional[ModelArtifactStore] = None, snapshot_path: Optional[str] = None,
+                 on_swap: Optional[Callable[[Predictor], None]] = None):
+        self._model = model
+        self.on_swap = on_swap
+        self._snapshot_path = snapshot_path
+        self.artifact_store = artifact_store
+        self.snapshot_dir = os.path.expanduser(snapshot_dir)
+        self.keep_snapshots = keep_snapshots
+        self._swap_lock = threading.Lock()
+        # Created on first use so processes forked from this one do not share its pipes
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def model(self) -> Predictor:
+        """The snapshot currently serving requests."""
+        return self._model
+
+    def retrain(self, raw_df: pd.DataFrame) -> Predictor:
+        """Train a new snapshot from scratch out of process, then swap it in. Blocks the caller, not the server."""
+        return self._train(raw_df, base_path=None)
+
+    def fine_tune(self, raw_df: pd.DataFrame) -> Predictor:
+        """Fine-tune the serving snapshot's weights on new rows out of process, then swap the result in."""
+        if self._snapshot_path is None:
+            raise ValueError("No saved snapshot to fine-tune. Run retrain first.")
+        return self._train(raw_df, base_path=self._snapshot_path)
+
+    def _train(self, raw_df: pd.DataFrame, base_path: Optional[str]) -> Predictor:
+        # The store may already hold newer versions than the one serving, e.g. when the boot fetch failed
+        published = self.artifact_store.latest_version() if self.artifact_store is not None else None
+        version = max(self._model.version, published or 0) + 1
+        output_path = os.path.join(self.snapshot_dir, f'v{version}')
+        logging.info("%s model version %d in a worker process", "Training" if base_path is None else "Fine-tuning", version)
+        if self._executor is None:
+            # spawn, not fork: the serving process may already have TensorFlow threads running
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_lower_priority
+            )
+        future = self._executor.submit(train_snapshot_timed, raw_df, output_path, version, self._model.backend,
+                                       self._model.options(), base_path)
+        snapshot_path, timings = future.result()
+        STAGE_SECONDS.merge(timings)
+
+        # Served from the memory-mapped weight files, like snapshots loaded from the artifact store
+        new_model = load_predictor(snapshot_path, history=self._model.history, mmap=True, build=False)
+        new_model.warm_up()
+        self.swap(new_model, snapshot_path)
+        if self.artifact_store is not None:
+            self.artifact_store.publish(snapshot_path, version)
+        self._prune_snapshots()
+        return new_model
+
+    def reload_latest(self) -> bool:
+        """Swap in the newest published snapshot if it is newer than the serving one.
+
+        Used by serving processes that do not train themselves. Returns True if a swap happened.
+        """
+        if self.artifact_store is None:
+            return False
+        snapshot_path = self.artifact_store.fetch_latest()
+        if snapshot_path is None or snapshot_path == self._snapshot_path:
+            return False
+        # Warmed up once the version check passes, here rather than on a request
+        new_model = load_predictor(snapshot_path, history=self._model.history, mmap=True, build=False)
+        if new_model.version <= self._model.version:
+            return False
+        new_model.warm_up()
+        self.swap(new_model, snapshot_path)
+        return True
+
+    def swap(self, new_model: Predictor, snapshot_path: Optional[str] = None) -> None:
+        """Make new_model the serving snapshot. snapshot_path is where it was saved, if anywhere."""
+        with self._swap_lock:
+            old_version = self._model.version
+            self._model = new_model
+            self._snapshot_path = snapshot_path
+        logging.info("Swapped serving model from version %d to %d", old_version, new_model.version)
+        if self.on_swap is not None:
+            self.on_swap(new_model)
+
+    def _prune_snapshots(self) -> None:
+        versions = sorted(
+            int(name[1:]) for name in os.listdir(self.snapshot_dir)
+            if name.startswith('v') and name[1:].isdigit()
+        )
+        for version in versions[:-self.keep_snapshots]:
+            shutil.rmtree(os.path.join(self.snapshot_dir, f'v{version}'), ignore_errors=True)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
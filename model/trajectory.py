@@ -0,0 +1,154 @@
+import logging
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# The spacing of the rows the LSTM is trained on; sequence_length 144 is 24 hours of it
+GRID_FREQ = pd.Timedelta(minutes=10)
+
+
+def haversine_distance(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Calculate distance between two points on Earth using Haversine formula."""
+    R = 6371  # Earth's radius in kilometers
+
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+    return R * c
+
+
+def detect_stay_points(df: pd.DataFrame, radius_m: float = 100.0,
+                       min_dwell: pd.Timedelta = pd.Timedelta(minutes=20)) -> Tuple[np.ndarray, pd.DataFrame]:
+    """Find the stretches where a device stayed within radius_m of where it arrived for at least min_dwell.
+
+    df must be sorted by timestamp. Returns a stay id per fix (-1 for fixes in transit) and one row
+    per stay with its arrival, departure, centroid and number of fixes.
+    """
+    lat = df['latitude'].to_numpy(dtype=np.float64)
+    lon = df['longitude'].to_numpy(dtype=np.float64)
+    timestamps = df['timestamp'].reset_index(drop=True)
+    radius_km = radius_m / 1000
+
+    # Start a new segment at every jump of more than the radius and at the first fix out of range of
+    # the segment's first fix (its anchor), scanning forward once
+    step = haversine_distance(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    starts = np.concatenate([[True], step > radius_km])
+    jumps = np.append(np.flatnonzero(starts), len(lat))
+    for begin, end in zip(jumps[:-1], jumps[1:]):
+        anchor = begin
+        while anchor < end - 1:
+            # Look for the first fix out of range in windows that double in size, so each anchor costs
+            # about as many distance evaluations as the fixes it covers
+            start, window = anchor + 1, 8
+            while start < end:
+                stop = min(end, start + window)
+                outside = np.flatnonzero(
+                    haversine_distance(lat[anchor], lon[anchor], lat[start:stop], lon[start:stop]) > radius_km
+                )
+                if len(outside):
+                    break
+                start, window = stop, window * 2
+            if start >= end:
+                break
+            anchor = start + outside[0]
+            starts[anchor] = True
+    segment = np.cumsum(starts) - 1
+
+    segments = pd.DataFrame({'segment': segment, 'timestamp': timestamps, 'latitude': lat, 'longitude': lon})
+    stays = segments.groupby('segment').agg(
+        arrival=('timestamp', 'first'), departure=('timestamp', 'last'),
+        latitude=('latitude', 'mean'), longitude=('longitude', 'mean'), fixes=('latitude', 'size')
+    )
+    stays = stays[stays['departure'] - stays['arrival'] >= min_dwell]
+    stay_ids = pd.Series(np.arange(len(stays)), index=stays.index)
+    labels = stay_ids.reindex(segment).fillna(-1).to_numpy(dtype=np.int64)
+    return labels, stays.reset_index(drop=True)
+
+
+def compress_trajectory(df: pd.DataFrame, radius_m: float = 100.0,
+                        min_dwell: pd.Timedelta = pd.Timedelta(minutes=20)) -> pd.DataFrame:
+    """Collapse each stay point to its arrival and departure fixes, placed at the stay's centroid.
+
+    Fixes in transit are kept as they are. The result has the input's columns plus `stay`, the stay
+    id of each row or -1.
+    """
+    df = df.sort_values('timestamp', ignore_index=True)
+    labels, stays = detect_stay_points(df, radius_m, min_dwell)
+    in_stay = labels >= 0
+    # The first and last fix of a stay mark the transitions into and out of it
+    boundary = np.concatenate([[True], labels[1:] != labels[:-1]]) | np.concatenate([labels[:-1] != labels[1:], [True]])
+    keep = ~in_stay | boundary
+
+    compressed = df.loc[keep].copy()
+    compressed['stay'] = labels[keep]
+    kept_stays = compressed['stay'].to_numpy()
+    stay_rows = kept_stays >= 0
+    compressed.loc[stay_rows, 'latitude'] = stays['latitude'].to_numpy()[kept_stays[stay_rows]]
+    compressed.loc[stay_rows, 'longitude'] = stays['longitude'].to_numpy()[kept_stays[stay_rows]]
+    return compressed.reset_index(drop=True)
+
+
+def resample_to_grid(df: pd.DataFrame, freq: pd.Timedelta = GRID_FREQ,
+                     max_gap: pd.Timedelta = pd.Timedelta(hours=1)) -> pd.DataFrame:
+    """Average fixes onto a regular grid of freq and fill the empty cells in between.
+
+    Empty cells inside a stay (see compress_trajectory) take the stay's centroid. Other empty cells are
+    interpolated in time when the gap around them is at most max_gap, and dropped otherwise, so
+    long outages are not invented. Returns timestamp, latitude and longitude.
+    """
+    stay = df['stay'] if 'stay' in df.columns else pd.Series(-1, index=df.index)
+    binned = pd.DataFrame({
+        'latitude': df['latitude'].to_numpy(),
+        'longitude': df['longitude'].to_numpy(),
+        'stay': stay.to_numpy(),
+    }, index=pd.DatetimeIndex(df['timestamp']).floor(freq)).groupby(level=0).agg(
+        latitude=('latitude', 'mean'), longitude=('longitude', 'mean'),
+        first_stay=('stay', 'first'), last_stay=('stay', 'last')
+    )
+    if binned.empty:
+        return pd.DataFrame(columns=['timestamp', 'latitude', 'longitude'])
+
+    grid = binned.reindex(pd.date_range(binned.index[0], binned.index[-1], freq=freq))
+    observed = grid['latitude'].notna()
+    observed_at = pd.Series(grid.index.where(observed), index=grid.index)
+    # A cell can hold one stay's departure and the next one's arrival, so compare the stay the
+    # previous cell ended in with the one the next cell started in
+    previous_stay, next_stay = grid['last_stay'].ffill(), grid['first_stay'].bfill()
+    inside_stay = (previous_stay == next_stay) & (previous_stay >= 0)
+    short_gap = observed_at.bfill() - observed_at.ffill() <= max_gap
+
+    positions = grid[['latitude', 'longitude']].interpolate(method='time', limit_area='inside')
+    # Arrival and departure cells may average in fixes from transit, so fill the cells between them
+    # from the stay's centroid rather than interpolating
+    fill_from_stay = (inside_stay & ~observed).to_numpy()
+    if fill_from_stay.any():
+        stay_rows = df[stay.to_numpy() >= 0]
+        centroids = stay_rows.groupby(stay[stay >= 0].to_numpy())[['latitude', 'longitude']].first()
+        positions.loc[fill_from_stay] = centroids.loc[previous_stay[fill_from_stay].astype(int)].to_numpy()
+    keep = observed | inside_stay | short_gap
+    resampled = positions[keep.to_numpy()].rename_axis('timestamp').reset_index()
+    return resampled
+
+
+def preprocess_fixes(df: pd.DataFrame, radius_m: float = 100.0, min_dwell: pd.Timedelta = pd.Timedelta(minutes=20),
+                     freq: pd.Timedelta = GRID_FREQ, max_gap: pd.Timedelta = pd.Timedelta(hours=1)) -> pd.DataFrame:
+    """Stay-point compression followed by resampling onto the training grid.
+
+    Takes and returns (timestamp, latitude, longitude) frames. Stationary jitter is replaced by the
+    stay centroid and the sampling rate no longer decides how many rows a period contributes.
+    """
+    df = df[['timestamp', 'latitude', 'longitude']].dropna()
+    df = df.assign(timestamp=pd.to_datetime(df['timestamp']))
+    if df.empty:
+        return df.reset_index(drop=True)
+    compressed = compress_trajectory(df, radius_m, min_dwell)
+    resampled = resample_to_grid(compressed, freq, max_gap)
+    logging.info("Preprocessed %d fixes into %d grid rows (%d kept after stay compression)",
+                 len(df), len(resampled), len(compressed))
+    return resampled